@@ -4,6 +4,7 @@ from mapengine import Scene, simpleloop, Hero, Actor, GameObject
 class ImageChanger(GameObject):
     icon_name = "hero"
     move_rate = 4
+    shared = True
     def on_over(self, other):
         if isinstance(other, Hero):
             if getattr(other, "_changer_image_name", None) != self.icon_name:
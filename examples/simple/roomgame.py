@@ -9,9 +9,11 @@ class SimpleActor(MainActor): #, FallingActor):
 
 class Wall(GameObject):
     hardness=10
+    shared = True
 
 class Ground(GameObject):
     hardness=5
+    shared = True
 
 def main():
     scene = Scene("room")
@@ -1,5 +1,7 @@
 # coding: utf-8
 
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict
 from copy import copy
 from functools import partial
 import logging
@@ -10,16 +12,34 @@ import sys
 
 import pygame
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from pygame.color import Color
 from pygame.sprite import Sprite, Group
 
-from .utils import resource_load, pwd, Vector, V
-from .palette import Palette
-from .fonts import FontLoader
+from .utils import resource_load, resource_path, pwd, RateMeter, Vector, V
+from .palette import Palette, pack_array
+from .fonts import FontLoader, text_cache
 from .cut import Cut
+from .render import OverlayRegions, TileRegions, prepare_surface
+from .registry import GameObjectClasses, GameObjectRegistry
+from .hardness import HardnessGrid
+from .spatial import SpatialIndex
+from .scheduler import Event, Scheduler, ObjectEvents
+from .resources import resources, add_path
+from .profiler import FrameProfiler, PhaseTimer, NULL_TIMER, profiler_from_environment, clock
 from .global_states import SCENE_PATH
 from .exceptions import GameOver, CutExit, RestartGame, SoftReset, Reset
 
+try:
+    from .flowfield import FlowField, target_cells
+except ImportError:
+    # flow fields need numpy
+    FlowField = target_cells = None
+
 SIZE = 800, 600
 FRAME_DELAY = 30
 
@@ -59,15 +79,33 @@ def add_scene_path(path):
     If you don't add a path explictly, mapengine tries to guess
     a "scenes/" directory from your working dir. But
     the mechanisms for it may not work that well.
+    The path can also be a zip archive, or a directory inside
+    one - as in "game.zip/scenes".
     """
-    SCENE_PATH.append(path)
+    add_path(SCENE_PATH, path)
 
 
 class Controller(object):
-    def __init__(self, size, scene=None, **kw):
+    """
+    Runs a game scene. A "headless" controller never creates a display:
+    it runs the game logic only - with no drawing, music, cut screens or
+    actor images - for tests, game balancing or AI training at full speed.
+    """
+    # worker thread for preload_scene, shared by all controllers
+    preloader = None
+    # flow fields kept - the least recently used ones are dropped
+    max_flow_fields = 8
+
+    def __init__(self, size, scene=None, headless=False, **kw):
         pygame.init()
+        self.headless = headless
         self.width, self.height = self.size = size
-        self.screen = pygame.display.set_mode(size, **kw)
+        self.screen = None if headless else pygame.display.set_mode(size, **kw)
+        # measured simulation ticks and drawn frames per second:
+        self.tick_meter = RateMeter()
+        self.frame_meter = RateMeter()
+        # per-phase timings - None when not profiling
+        self.profiler = profiler_from_environment()
 
         try:
             self.hard_reset()
@@ -85,24 +123,50 @@ class Controller(object):
         return self.soft_reset()
 
     def soft_reset(self, raise_=True):
-        self.actor_positions = {}
         self.old_top = -20
         self.old_left = -20
         self.old_tiles = {}
         self.dirty_tiles = {}
+        self.scrolled = False
         self.force_redraw = False
+        # screen rectangles drawn since the last "present":
+        self.updated_rects = []
+        self.full_update = True
         self.post_cut_action = None
         if raise_:
             raise SoftReset
 
+    def preload_scene(self, scene):
+        """
+        Starts reading and decoding the files of scene in a background thread,
+        so that a later "load_scene(scene)" finds its data ready.
+        Returns the concurrent.futures.Future for the prefetched data.
+        """
+        if scene.prefetched is None:
+            if Controller.preloader is None:
+                Controller.preloader = ThreadPoolExecutor(max_workers=1)
+            scene.prefetched = self.preloader.submit(scene.prefetch, self.headless)
+        return scene.prefetched
+
     def load_scene(self, scene, skip_post_cut=False, skip_pre_cut=False):
         if getattr(self, "scene", None) and self.scene.post_cut and not skip_post_cut:
+            # the new scene is read while the cut is shown
+            self.preload_scene(scene)
             post_cut_action = partial(self.load_scene, scene, skip_post_cut=True, skip_pre_cut=skip_pre_cut)
             return self.enter_cut(self.scene.post_cut, post_cut_action)
 
         self.scene = scene
+        # Delayed events of all game objects, by frame:
+        self.tick = 0
+        self.scheduler = Scheduler()
         scene.set_controller(self)
         self.all_actors = Group()
+        # actors by position - kept up to date as they move:
+        self.actor_index = SpatialIndex(observer=scene.hardness_grid)
+        # created by the first find_path:
+        self.pathfinder = None
+        # by strength and target:
+        self.flow_fields = OrderedDict()
         self.actors = {}
         self.load_initial_actors()
         self.messages = Group()
@@ -111,12 +175,17 @@ class Controller(object):
 
     def enter_cut(self, cut, post_action=None):
         self.post_cut_action = post_action
+        if self.headless:
+            # Cuts are skipped: go straight to what follows them
+            return self.leave_cut()
         self.inside_cut = True
         self.current_cut = cut(self)
         return self.update()
 
     def leave_cut(self):
         self.inside_cut = False
+        # the cut has drawn over the whole screen
+        self.force_redraw = True
         if self.post_cut_action:
             action = self.post_cut_action
             self.post_cut_action = None
@@ -126,18 +195,47 @@ class Controller(object):
         self.current_cut.update()
 
     def load_initial_actors(self):
-        for x in range(self.scene.width):
-            for y in range(self.scene.height):
-                cls = self.scene.get_actor_at((x, y))
-                if not cls:
-                    continue
-                name = cls.__name__.lower()
-                actor = cls(self, pos=(x, y))
-                self.all_actors.add(actor)
-                self.actors.setdefault(name, Group())
-                self.actors[name].add(actor)
-                if getattr(actor, "main_character", False):
-                    self.set_main_character(actor)
+        for pos, cls in self.scene.iter_actor_spawns():
+            self.spawn_actor(cls, pos)
+
+    def spawn_actor(self, cls, pos):
+        actor = cls(self, pos=pos)
+        self.add_actor(actor)
+        return actor
+
+    def add_actor(self, actor):
+        name = actor.__class__.__name__.lower()
+        self.all_actors.add(actor)
+        self.actor_index.add(actor)
+        self.actors.setdefault(name, Group())
+        self.actors[name].add(actor)
+        if getattr(actor, "main_character", False):
+            self.set_main_character(actor)
+
+    def suspend_actors(self, region):
+        """
+        Takes the actors inside region - (left, top, width, height), in blocks -
+        out of the game, without killing them. Returns the list of suspended actors.
+        The main character is never suspended.
+        """
+        left, top, width, height = region
+        suspended = []
+        for actor in self.all_actors:
+            if getattr(actor, "main_character", False):
+                continue
+            if left <= actor.pos[0] < left + width and top <= actor.pos[1] < top + height:
+                self.suspend_actor(actor)
+                suspended.append(actor)
+        return suspended
+
+    def suspend_actor(self, actor):
+        self.all_actors.remove(actor)
+        self.actor_index.remove(actor)
+        self.actors[actor.__class__.__name__.lower()].remove(actor)
+
+    def resume_actors(self, actors):
+        for actor in actors:
+            self.add_actor(actor)
 
     def set_main_character(self, actor):
         self.main_character = Group()
@@ -155,30 +253,93 @@ class Controller(object):
             return False
         return actor1.rect.colliderect(actor2.rect)
 
+    tick_rate = property(lambda self: self.tick_meter.rate)
+    frame_rate = property(lambda self: self.frame_meter.rate)
+
     def update(self):
         if self.inside_cut:
             try:
                 return self.draw_cut()
             except CutExit:
                 self.leave_cut()
+        if self.step() and not self.headless:
+            self.draw()
+
+    def enable_profiler(self, capacity=600):
+        self.profiler = FrameProfiler(capacity)
+        return self.profiler
+
+    def run(self, ticks):
+        """
+        Runs the game for a number of ticks back to back, with no
+        delays between them. Meant for headless controllers.
+        """
+        for _ in range(ticks):
+            self.update()
+
+    def timer(self):
+        """
+        A PhaseTimer for a tick or frame, when profiling - or one that does nothing
+        """
+        return NULL_TIMER if self.profiler is None else PhaseTimer(self.profiler)
+
+    def step(self):
+        """
+        Advances the game by one tick, without drawing anything.
+        Returns False if the game was reset during the tick.
+        """
+        self.tick_meter.mark()
+        timer = self.timer()
         try:
-            self.scene.update()
+            timer.call("scene", self.scene.update)
+            self.tick += 1
+            timer.call("events", self.scheduler.run, self.tick)
+            update_actor = timer.wrap("actors", self.update_actor, by_class=True)
+            actor_collisions = timer.wrap("collisions", self.actor_collisions)
             for actor in self.all_actors:
-                if actor.off_screen_update or self.is_position_on_screen(actor.pos):
-                    actor.update()
-                for collision in pygame.sprite.spritecollide(actor, self.all_actors, False, collided=self._touch):
-                    actor.on_over(collision)
-                if isinstance(self.scene[actor.pos], GameObject):
-                    self.scene[actor.pos].on_over(actor)
-            self.draw()
+                update_actor(actor)
+                actor_collisions(actor)
         except SoftReset:
-            pass
+            return False
+        timer.flush()
+        return True
 
+    def update_actor(self, actor):
+        if actor.off_screen_update or self.is_position_on_screen(actor.pos):
+            actor.update()
 
-    def draw(self):
-        self.background()
-        self.draw_actors()
-        self.display_messages()
+    def actor_collisions(self, actor):
+        for collision in self.actor_index.colliding(actor, self._touch):
+            actor.on_over(collision)
+        if isinstance(self.scene[actor.pos], GameObject):
+            self.scene[actor.pos].on_over(actor)
+
+    def draw(self, alpha=None):
+        """
+        Draws the current game state. "alpha", from 0 to 1, is how far
+        the time of drawing is from the last tick towards the next one:
+        moving actors are drawn at the matching point of their movement.
+        """
+        if self.headless:
+            return
+        self.frame_meter.mark()
+        timer = self.timer()
+        timer.call("background", self.background)
+        timer.call("draw_actors", self.draw_actors, alpha)
+        timer.call("messages", self.display_messages)
+        timer.flush()
+        if self.profiler is not None and self.profiler.show_overlay:
+            self.display_profile()
+
+    def display_profile(self):
+        if not hasattr(self, "profile_font"):
+            self.profile_font = FontLoader(size=12, bold=False)
+        image = self.profiler.overlay(self.profile_font)
+        self.updated_rects.append(self.screen.blit(image, (0, 0)))
+        scale = self.scene.blocksize
+        for x in range(image.get_width() // scale + 1):
+            for y in range(image.get_height() // scale + 1):
+                self.dirty_tiles[x, y] = True
 
     scale = property(lambda self: self.scene.blocksize)
     # These hold the on-screen size of the game-scene in blocks
@@ -191,14 +352,40 @@ class Controller(object):
                 yield x, y
 
     def background(self):
-        if self.scene.overlay_image:
-            self.overlay_background()
+        delta_x = self.scene.left - self.old_left
+        delta_y = self.scene.top - self.old_top
+        self.scrolled = False
+        if self.force_redraw or delta_x or delta_y:
+            self.full_update = True
+            if not self.force_redraw and abs(delta_x) < self.blocks_x and abs(delta_y) < self.blocks_y:
+                self.scroll_screen(delta_x, delta_y)
+        if self.scene.background_regions is not None:
+            self.region_background()
         else:
             self.block_background()
         self.old_left = self.scene.left
         self.old_top = self.scene.top
         self.force_redraw = False
 
+    def scroll_screen(self, delta_x, delta_y):
+        """
+        Moves what is already drawn on the screen by the scrolled amount of blocks,
+        so that only the newly exposed strips (and dirty tiles) need to be drawn.
+        """
+        scale = self.scale
+        self.screen.scroll(-delta_x * scale, -delta_y * scale)
+        visible_x = range(self.blocks_x)
+        visible_y = range(self.blocks_y)
+        self.old_tiles = dict(
+            ((x - delta_x, y - delta_y), image) for (x, y), image in self.old_tiles.items()
+            if x - delta_x in visible_x and y - delta_y in visible_y
+        )
+        self.dirty_tiles = dict(
+            ((x - delta_x, y - delta_y), dirty) for (x, y), dirty in self.dirty_tiles.items()
+            if x - delta_x in visible_x and y - delta_y in visible_y
+        )
+        self.scrolled = (delta_x, delta_y)
+
     def block_background(self):
         scene = self.scene
         scale = self.scale
@@ -216,29 +403,58 @@ class Controller(object):
             pygame.draw.rect(self.screen, image, (x * scale, y * scale, scale, scale))
         else:  # image
             self.screen.blit(image, (x * scale, y * scale))
+        self.updated_rects.append((x * scale, y * scale, scale, scale))
         self.old_tiles[pos] = image
         self.dirty_tiles.pop(pos, False)
 
-    def overlay_background(self):
+    def region_background(self):
+        """
+        Draws the background from the scene pre-rendered chunks (or zoomed
+        overlay regions): the whole screen when needed, otherwise just the strips
+        exposed by scrolling and the dirty tiles - tiles with images changed
+        by their objects are dirty.
+        """
         scene = self.scene
-        if not self.force_redraw and self.old_left == scene.left and self.old_top == scene.top:
-            return self._draw_overlay_tiles()
-        pixel_left = scene.left * scene.blocksize
-        pixel_top = scene.top * scene.blocksize
-        self.screen.blit(scene.overlay_image, (0, 0), area=(pixel_left, pixel_top, self.width, self.height))
+        if isinstance(scene.background_regions, TileRegions):
+            right, bottom = scene.left + self.blocks_x + 1, scene.top + self.blocks_y + 1
+            for x, y in scene.background_regions.repaint_changed(scene.left, scene.top, right, bottom):
+                self.dirty_tiles[x - scene.left, y - scene.top] = True
+        if self.scrolled:
+            self._draw_region_strips(*self.scrolled)
+        elif self.force_redraw or self.old_left != scene.left or self.old_top != scene.top:
+            self._draw_region_area(0, 0, self.width, self.height)
+            self.dirty_tiles = {}
+            return
+        self._draw_region_tiles()
 
-    def _draw_overlay_tiles(self):
+    def _draw_region_area(self, left, top, width, height):
+        # Draws a screen area - in pixels - from the scene background regions
         scene = self.scene
-        blocksize = scene.blocksize
+        regions = scene.background_regions
+        pixel_left = scene.left * scene.blocksize + left
+        pixel_top = scene.top * scene.blocksize + top
+        if (pixel_left < 0 or pixel_top < 0 or pixel_left + width > regions.full_size[0] or
+                pixel_top + height > regions.full_size[1]):
+            self.screen.fill(scene.out_of_map, (left, top, width, height))
+        regions.blit(self.screen, (left, top), (pixel_left, pixel_top, width, height))
+        self.updated_rects.append((left, top, width, height))
+
+    def _draw_region_strips(self, delta_x, delta_y):
+        # Draws the screen strips exposed by scrolling "delta" blocks
+        blocksize = self.scene.blocksize
+        strip_width = abs(delta_x) * blocksize
+        strip_height = abs(delta_y) * blocksize
+        if delta_x:
+            self._draw_region_area(self.width - strip_width if delta_x > 0 else 0, 0, strip_width, self.height)
+        if delta_y:
+            self._draw_region_area(0, self.height - strip_height if delta_y > 0 else 0, self.width, strip_height)
+
+    def _draw_region_tiles(self):
+        blocksize = self.scene.blocksize
         for pos, dirty in list(self.dirty_tiles.items()):
             if not dirty:
                 continue
-            pixel_left = (scene.left + pos[0]) * blocksize
-            pixel_top = (scene.top + pos[1]) * blocksize
-            local_left = blocksize * pos[0]
-            local_top = blocksize * pos[1]
-            self.screen.blit(scene.overlay_image, (local_left, local_top),
-                             area=(pixel_left, pixel_top, blocksize, blocksize))
+            self._draw_region_area(blocksize * pos[0], blocksize * pos[1], blocksize, blocksize)
             self.dirty_tiles.pop(pos)
 
     def is_position_on_screen(self, pos):
@@ -248,29 +464,35 @@ class Controller(object):
     def to_screen(self, pos):
         return V((pos[0] - self.scene.left, pos[1] - self.scene.top))
 
-    def draw_actors(self):
+    def draw_actors(self, alpha=None):
         scale = self.scene.blocksize
-        scene = self.scene
-        self.actor_positions = {}
+        left, top = self.scene.left, self.scene.top
+        dirty_tiles = self.dirty_tiles
+        # screen positions are worked out component by component:
+        # this runs for every actor on screen, every frame
         for actor in self.all_actors:
-            self.actor_positions[actor.pos] = actor
             if not self.is_position_on_screen(actor.pos):
                 continue
             if not actor.image:
                 continue
-            x, y = pos = self.to_screen(actor.pos)
+            x = actor.pos[0] - left
+            y = actor.pos[1] - top
             if actor.speed:
-                # import ipdb; ipdb.set_trace()
-                old_pos = self.to_screen(actor.old_pos)
-                ipos = old_pos + (pos - old_pos) * actor.speed * min((actor.tick - actor.move_direction_count), actor.base_move_rate)
-                x, y = ipos
-                self.dirty_tiles[old_pos] = True
-                self.dirty_tiles[pos] = True
-                self.dirty_tiles[V((old_pos.x, pos.y))] = True
-                self.dirty_tiles[V((pos.x, old_pos.y))] = True
+                old_x = actor.old_pos[0] - left
+                old_y = actor.old_pos[1] - top
+                elapsed = actor.tick - actor.move_direction_count
+                if alpha is not None:
+                    elapsed = max(0, elapsed - 1 + alpha)
+                progress = min(elapsed, actor.base_move_rate)
+                dirty_tiles[old_x, old_y] = True
+                dirty_tiles[x, y] = True
+                dirty_tiles[old_x, y] = True
+                dirty_tiles[x, old_y] = True
+                x = old_x + (x - old_x) * actor.speed * progress
+                y = old_y + (y - old_y) * actor.speed * progress
             else:
-                self.dirty_tiles[pos] = True
-            self.screen.blit(actor.image, (x * scale, y * scale))
+                dirty_tiles[x, y] = True
+            self.updated_rects.append(self.screen.blit(actor.image, (x * scale, y * scale)))
 
     def display_messages(self):
         scale = self.scene.blocksize
@@ -284,20 +506,97 @@ class Controller(object):
             position = self.to_screen(message.owner.pos)
             x = position[0] + 0.5
             y = position[1] + 1
-            self.screen.blit(image, (int(x * scale), y * scale))
+            self.updated_rects.append(self.screen.blit(image, (int(x * scale), y * scale)))
             for j in range(0, (image.get_width() // scale) + 2):
                 for k in range(0, (image.get_height() // scale) + 1):
                     self.dirty_tiles[int(x) + j, y + k] = True
 
+    def present(self):
+        """
+        Shows what was drawn since the last call on the display: only the
+        touched screen rectangles are updated, unless the whole screen was
+        redrawn (on scrolling or forced redraws).
+        """
+        if self.headless:
+            return
+        start = clock()
+        if self.full_update:
+            pygame.display.flip()
+        elif self.updated_rects:
+            pygame.display.update(self.updated_rects)
+        self.updated_rects = []
+        self.full_update = False
+        if self.profiler is not None:
+            self.profiler.add("present", clock() - start)
+
+    def find_path(self, start, goal, strength):
+        """
+        Positions an actor with the given strength walks through, from
+        start to goal - or None if there is no way (see pathfinding.PathFinder)
+        """
+        if self.pathfinder is None:
+            from .pathfinding import PathFinder
+            self.pathfinder = PathFinder(self.scene)
+        return self.pathfinder.find_path(start, goal, strength)
+
+    def flow_field(self, strength=4, target=None):
+        """
+        FlowField leading actors with the given strength to target - a position,
+        a list of positions, or an actor, followed as it moves - or, if None,
+        the main character. Fields are shared by everyone asking for the same
+        strength and target, and only the "max_flow_fields" last used are kept.
+
+        Flow fields cover the whole map, and need numpy: use them with scenes
+        kept in memory - for scenes loaded in chunks, every chunk is read to
+        compute a field.
+        """
+        if FlowField is None:
+            raise ImportError("Flow fields need numpy")
+        key = (strength, target if hasattr(target, "pos") else target_cells(target))
+        field = self.flow_fields.get(key)
+        if field is not None:
+            self.flow_fields.move_to_end(key)
+            return field
+        if self.scene.chunk_loader is not None:
+            logger.error("Flow fields read the whole map: scene {} is loaded in chunks".format(self.scene.scene_name))
+        field = self.flow_fields[key] = FlowField(self, strength, target)
+        while len(self.flow_fields) > self.max_flow_fields:
+            self.flow_fields.popitem(last=False)
+        return field
+
+    def hardness_at(self, position):
+        """
+        Hardness of what is at position - as for controller[position], the
+        actor there, or else the tile, read from the scene hardness grid.
+        """
+        actor = self.actor_index.at(position)
+        if actor is not None:
+            return getattr(actor, "hardness", 0)
+        return self.scene.hardness_grid.at(position[0], position[1])
+
+    def blocked(self, positions, strength):
+        """
+        Whether each of positions - a sequence of (x, y), or an array of shape (n, 2) -
+        has something harder than strength, as given by hardness_at.
+        Returns a boolean array - or a list, with no numpy.
+        """
+        hardness = self.scene.hardness_grid.values(positions, self.actor_index)
+        if numpy is None:
+            return [value > strength for value in hardness]
+        return hardness > strength
+
     def __getitem__(self, pos):
         """
         Position is relative to the scene
         """
-        if pos in self.actor_positions:
-            return self.actor_positions[pos]
+        actor = self.actor_index.at(pos)
+        if actor is not None:
+            return actor
         return self.scene[pos]
 
     def quit(self):
+        if self.profiler is not None and self.profiler.output:
+            self.profiler.dump(self.profiler.output)
         pygame.quit()
 
 
@@ -322,6 +621,10 @@ class Scene(object):
                          # 'overlay' will load a <name>_overlay.png file that will be 
                          # displayed as game background instead of block tiles
 
+    render_chunk_size 16           # the background is pre-rendered in square chunks of this many blocks
+                                   # (0 to draw block tiles one by one)
+    render_cache_bytes 67108864    # memory budget for pre-rendered background chunks (64MB)
+
     scroll_rate 8
 
     out_of_map self.out_of_map
@@ -334,6 +637,15 @@ class Scene(object):
 
     game_over_cut None
     music None
+
+    chunk_size None      # For maps too big for memory: the map is loaded in chunks of
+                         # chunk_size x chunk_size blocks as the view approaches them
+    chunk_margin 1       # chunks around the view in which actors are kept running
+    suspended_chunks 64  # inactive chunks whose actors are kept suspended - past that, the
+                         # chunks left the longest ago spawn their map actors anew
+
+    compiled_cache None  # True: keep compiled scenes in a "__mapcache__" dir by the map file
+                         # or the path of a directory to keep compiled scenes in.
     """
 
     def __init__(self, scene_name, **kw):
@@ -342,8 +654,12 @@ class Scene(object):
         self.mapfile = scene_name
         self.mapdescription = scene_name + ".gpl"
         self.overlay_image = None
+        self.background_regions = None
+        self.chunk_loader = None
 
         self.cached_images = {}
+        # Future for the data read by "prefetch" (see Controller.preload_scene)
+        self.prefetched = None
 
         # TODO: factor this out to a mixin "autoattr" class
         for line in self.attributes.split("\n"):
@@ -362,7 +678,7 @@ class Scene(object):
                 ("Start new game", self.default_game_over_continue),
                 ("Exit", self.default_game_over_exit),
             ])
-        SCENE_PATH.append(os.path.join(pwd(2), self.scene_path_prefix))
+        add_path(SCENE_PATH, os.path.join(pwd(2), self.scene_path_prefix))
 
     @staticmethod
     def default_game_over_exit(controller):
@@ -377,13 +693,14 @@ class Scene(object):
         self.controller = controller
         if not self.display_size:
             self.display_size = SIZE
-        self.load()
         self.tiles = {}
+        self.load()
         self.background_plane = {}
 
         self.scroll_count = 0
-        self.music_load(self.music)
-        self.start_music()
+        if not controller.headless:
+            self.music_load(self.music)
+            self.start_music()
 
     def load_attr(self, attrname, default, kw):
         if isinstance(default, str):
@@ -395,91 +712,454 @@ class Scene(object):
                 default = None
         setattr(self, attrname, kw.get(attrname, default))
 
-    def image_load(self, filename=None, sufix="", **kw):
+    def image_filename(self, filename=None, sufix=""):
         if not filename:
             filename = self.mapfile
         if not filename.lower().endswith((".png", ".bmp", ".tif", ".tiff")):
             filename += sufix + ".png"
-        return resource_load(filename, paths=SCENE_PATH, cache=self.cached_images, loader=pygame.image.load, **kw)
+        return filename
+
+    @staticmethod
+    def prepared_image_load(path):
+        return prepare_surface(pygame.image.load(path))
+
+    def image_load(self, filename=None, sufix="", prepare=True, **kw):
+        """
+        Loads an image from the scene path. Images are converted to the display
+        pixel format - but for map planes, whose pixels are read
+        as they are, which should be loaded with prepare=False.
+        """
+        filename = self.image_filename(filename, sufix)
+        loader = self.prepared_image_load if prepare else pygame.image.load
+        return resource_load(filename, paths=SCENE_PATH, cache=self.cached_images, loader=loader, **kw)
 
     def start_music(self):
         if getattr(self, "music_path", None):
-            self.playing = pygame.mixer.music.load(self.music_path)
+            self.playing = pygame.mixer.music.load(resources.source(self.music_path))
             pygame.mixer.music.play(-1)
 
     def music_load(self, filename):
-        resource_load(filename, paths=SCENE_PATH, loader=lambda path: setattr(self, "music_path", path))
+        self.music_path = resource_path(filename, SCENE_PATH)
 
     def load(self):
-        self.image = self.image_load(force=True)
+        # Scene blocksize in pixels:
+        self.blocksize = self.display_size[0] // self.window_width
+        prefetched = self.take_prefetched()
+
+        self.chunk_loader = None
+        if self.chunk_size:
+            self.load_chunks()
+        elif "bundle" in prefetched:
+            self.load_bundle(prefetched["bundle"])
+        elif "sources" in prefetched or not (self.compiled_cache and self.load_bundle()):
+            self.load_sources(prefetched.get("sources"))
+            # headless scenes have no tile images to store in the bundle
+            if self.compiled_cache and self.tile_grid is not None and not self.controller.headless:
+                self.save_bundle()
+        self.hardness_grid = HardnessGrid(self)
+        if self.controller.headless:
+            self.background_regions = None
+            return
+        for name, image in prefetched.get("tiles", {}).items():
+            # prefetched tiles are fresh surfaces, shared with no image cache
+            self.tiles.setdefault(name, prepare_surface(image, rle=True))
+        self.load_overlay(prefetched.get("overlay"))
+        if self.overlay_image:
+            self.background_regions = self.overlay_image
+        elif self.render_chunk_size:
+            self.background_regions = TileRegions(
+                self, region_size=self.render_chunk_size, max_bytes=self.render_cache_bytes
+            )
+        else:
+            self.background_regions = None
+
+    def prefetch(self, headless=False):
+        """
+        Does the file reading, decoding and scaling of "load" ahead of time,
+        returning the results in a dictionary. No scene attributes are set, and
+        images are not converted to the display format, so that this can run
+        in another thread - see Controller.preload_scene.
+        """
+        data = {}
+        if self.chunk_size:
+            # chunked scenes are read around the view as it moves
+            return data
+        blocksize = (self.display_size or SIZE)[0] // self.window_width
+        if self.compiled_cache and numpy is not None:
+            from .bundle import SceneBundle
+            bundle = SceneBundle.for_scene(self, blocksize)
+            if bundle is not None and bundle.is_valid(self):
+                data["bundle"] = bundle
+        if "bundle" not in data:
+            sources = data["sources"] = self.read_sources()
+        if headless:
+            return data
+        if self.display_type == "overlay":
+            filename = self.image_filename(sufix=self.overlay_plane_sufix)
+            overlay = resource_load(filename, paths=SCENE_PATH, loader=pygame.image.load)
+            if overlay is not None:
+                data["overlay"] = overlay
+        elif "sources" in data and sources["tile_grid"] is not None:
+            data["tiles"] = tiles = {}
+            palette = sources["palette"]
+            for index in numpy.unique(sources["tile_grid"]).tolist():
+                name = palette.name_at(index) if index >= 0 else None
+                if name is None or name.lower() in GameObjectClasses:
+                    continue
+                image = resource_load(self.image_filename(name), paths=SCENE_PATH, loader=pygame.image.load)
+                if image is not None:
+                    tiles[name] = self.scaled_tile(image, blocksize)
+        return data
+
+    def take_prefetched(self):
+        """
+        Data read by a "prefetch" started with Controller.preload_scene - or an empty
+        dictionary if there was none. A prefetch that has not started yet is cancelled,
+        and one that is running is waited for - that takes less than starting over.
+        """
+        future, self.prefetched = self.prefetched, None
+        if future is None or future.cancel():
+            return {}
+        try:
+            return future.result()
+        except Exception as error:
+            logger.error("Prefetching scene {} failed: {}".format(self.scene_name, error))
+            return {}
+
+    def read_sources(self):
+        """
+        Reads the map and actor planes and the palette, and decodes the planes.
+        Returns the values for the scene attributes, without setting them.
+        """
+        image = self.image_load(prepare=False, force=True)
         empty_plane = pygame.surface.Surface((1, 1))
-        self.actor_plane = self.image_load(sufix=self.actor_plane_sufix, default=empty_plane)
-        if self.actor_plane is empty_plane:
+        actor_plane = self.image_load(sufix=self.actor_plane_sufix, prepare=False, default=empty_plane)
+        if actor_plane is empty_plane:
             logger.error("Could not find character plane for scene {}".format(self.scene_name))
-        self.palette = resource_load(self.mapdescription, paths=SCENE_PATH, loader=Palette)
-        #Palette(self.mapdescription)
+        palette = resource_load(self.mapdescription, paths=SCENE_PATH, loader=Palette)
+        return {
+            "image": image,
+            "actor_plane": actor_plane,
+            "palette": palette,
+            "tile_grid": self.decode_plane(image, palette=palette),
+            "actor_grid": self.decode_plane(actor_plane, skip_transparent=True, palette=palette),
+        }
+
+    def load_sources(self, sources=None):
+        if sources is None:
+            sources = self.read_sources()
+        self.__dict__.update(sources)
         self.width, self.height = self.image.get_size()
+        self.color_grid = None
+        self.actor_spawns = None
 
-        # Scene blocksize in pixels:
-        self.blocksize = self.display_size[0] // self.window_width
+    def load_bundle(self, bundle=None):
+        """
+        Loads the scene from its compiled bundle, if there is an up to date one.
+        A bundle given as argument must have been already validated.
+        """
+        if numpy is None:
+            return False
+        from .bundle import SceneBundle
+        if bundle is None:
+            bundle = SceneBundle.for_scene(self)
+            if bundle is None or not bundle.is_valid(self):
+                return False
+        images = bundle.load_into(self)
+        for name, image in images.items():
+            if name not in GameObjectClasses:
+                self.tiles[name] = prepare_surface(image)
+        logger.debug("Scene '{}' loaded from '{}'".format(self.scene_name, bundle.path))
+        return True
+
+    def save_bundle(self):
+        from .bundle import SceneBundle
+        bundle = SceneBundle.for_scene(self)
+        if bundle is None:
+            return
+        tile_names = sorted(set(
+            self.palette.name_at(index) for index in numpy.unique(self.tile_grid).tolist() if index >= 0
+        ))
+        tile_images = {}
+        for name in tile_names:
+            if name.lower() in GameObjectClasses:
+                continue
+            tile = self._tile_for_name(name, self.palette[name], None)
+            if isinstance(tile, pygame.Surface):
+                tile_images[name] = tile
+        try:
+            bundle.save(self, tile_names, tile_images)
+        except (IOError, OSError) as error:
+            logger.error("Could not write compiled scene to '{}': {}".format(bundle.path, error))
 
+    def load_chunks(self):
+        """
+        Sets up the scene to be read from a chunked copy of the map, which
+        is created, from the source files, if needed.
+        """
+        from .chunks import ChunkStore, ChunkLoader
+        store = ChunkStore.for_scene(self)
+        if store is None:
+            logger.error("No directory to store the chunks of scene {} - set its compiled_cache. Loading it whole.".format(self.scene_name))
+            self.load_sources()
+            return
+        if not store.is_valid(self):
+            self.load_sources()
+            store.build(self)
+        store.open()
+        self.image = self.actor_plane = None
+        self.tile_grid = self.actor_grid = self.color_grid = None
+        self.actor_spawns = None
+        self.palette = store.palette
+        self.width, self.height = store.size
+        self.chunk_loader = ChunkLoader(store, margin=self.chunk_margin, suspended_chunks=self.suspended_chunks)
+        self.chunk_loader.on_evict = self.forget_region
+
+    def forget_region(self, left, top, width, height):
+        for x in range(left, left + width):
+            for y in range(top, top + height):
+                self.background_plane.pop((x, y), None)
+
+    def update_chunks(self):
+        """
+        Loads the chunks the view is approaching, and suspends the actors in
+        the ones left behind.
+        """
+        loader = self.chunk_loader
+        controller = self.controller
+        activated, deactivated = loader.update(self.left, self.top, controller.blocks_x, controller.blocks_y)
+        for key in deactivated:
+            self._drop_actors(loader.suspend(key, controller.suspend_actors(loader.region(key))))
+        for key in activated:
+            actors, to_spawn = loader.resume(key)
+            controller.resume_actors(actors)
+            if to_spawn:
+                for pos, cls in self._chunk_spawns(key):
+                    controller.spawn_actor(cls, pos)
+
+    def actor_moved(self, actor, old_pos):
+        """
+        Called when an actor moves in a chunked scene: actors that
+        walk into an inactive chunk are suspended there.
+        """
+        loader = self.chunk_loader
+        key = loader.key(actor.pos)
+        if key == loader.key(old_pos) or key in loader.active:
+            return
+        if not (0 <= actor.pos[0] < self.width and 0 <= actor.pos[1] < self.height):
+            return
+        controller = self.controller
+        if actor not in controller.actor_index or getattr(actor, "main_character", False):
+            return
+        controller.suspend_actor(actor)
+        self._drop_actors(loader.suspend(key, [actor]))
+
+    def _drop_actors(self, actors):
+        # dropped from memory, not killed in the game
+        for actor in actors:
+            actor.detach()
+
+    def _main_character_indexes(self):
+        return set(
+            index for index, name in enumerate(self.palette.names)
+            if getattr(GameObjectClasses.get(name), "main_character", False)
+        )
+
+    def _chunk_spawns(self, key):
+        main_indexes = self._main_character_indexes()
+        for pos, index in self.chunk_loader.chunk(key).spawns:
+            cls = GameObjectClasses.get(self.palette.name_at(index), None)
+            if cls and index not in main_indexes:
+                yield pos, cls
+
+    def load_overlay(self, overlay_image=None):
         if self.display_type == "overlay":
             try:
-                overlay_image = self.image_load(sufix=self.overlay_plane_sufix)
-                ratio =  float(self.width * self.blocksize) / overlay_image.get_width()
-                # TODO: this image can become too large for big maps
-                # make use of a lazy-zooming mechanism to scale the overlay to full-size
-                # only on the displayed area.
-                self.overlay_image = pygame.transform.rotozoom(overlay_image, 0, ratio)
+                if overlay_image is None:
+                    overlay_image = self.image_load(sufix=self.overlay_plane_sufix)
+                else:
+                    overlay_image = prepare_surface(overlay_image)
+                # The overlay is only zoomed to full-size around the displayed area
+                self.overlay_image = OverlayRegions(
+                    overlay_image, self.width, self.blocksize,
+                    region_size=self.render_chunk_size or 16, max_bytes=self.render_cache_bytes
+                )
             except (pygame.error, IOError):
                 logger.error("Could not load overlay image '{}.png'".format(self.mapfile + self.overlay_plane_sufix))
 
+    @staticmethod
+    def pack_plane(surface):
+        """
+        Returns the colors of a surface as a grid of 32bit RGBA integers
+        """
+        rgb = pygame.surfarray.array3d(surface)
+        alpha = pygame.surfarray.array_alpha(surface)
+        return pack_array(numpy.dstack((rgb, alpha)))
+
+    def decode_plane(self, surface, skip_transparent=False, palette=None):
+        """
+        Decodes a whole map plane in a single pass into a grid (indexed by [x, y])
+        of palette indexes. Pixels whose color is not in the palette are set to -1.
+        Uses the scene palette if no other palette is given.
+
+        Returns None if numpy is not available - in that case pixels are
+        looked up one by one as they are needed.
+        """
+        if numpy is None:
+            return None
+        if palette is None:
+            palette = self.palette
+        packed = self.pack_plane(surface)
+        grid = palette.indices(packed)
+        if skip_transparent:
+            grid[(packed & 0xff) == 0] = -1
+        if len(palette.packed) < 2 ** 15:
+            grid = grid.astype(numpy.int16)
+        return grid
+
+    def _in_grid(self, grid, position):
+        x, y = position
+        return 0 <= x < grid.shape[0] and 0 <= y < grid.shape[1]
+
 
     def __getitem__(self, position):
-        if not position in self.background_plane:
-            self.background_plane[position] = self._raw_getitem(position)
+        tile = self.background_plane.get(position)
+        if tile is None:
+            tile, shared = self._lookup(position)
+            if not shared:
+                self.background_plane[position] = tile
             # Self.objects contain static scene objects that may have attributes
             # (such as hardness) - animated game Characters should derive
             # from "Actor", and are "over" the scene: they are retrievable by
             # "Scene.get_actor_at"
-        return self.background_plane[position]
+        return tile
+
+    def __setitem__(self, position, name):
+        """
+        Changes the tile at a map position to the one of the given palette color name.
+        (For chunked scenes, the change lasts while the chunk is kept in memory)
+        """
+        color = self.palette[name]
+        if self.tile_grid is not None:
+            self.tile_grid[position[0], position[1]] = self.palette.index(color)
+        elif self.chunk_loader is not None:
+            chunk, x, y = self.chunk_loader._cell(position)
+            chunk.tiles[x, y] = self.palette.index(color)
+        else:
+            self.image.set_at(position, color)
+        self.background_plane.pop(position, None)
+        self.tile_changed(position)
+
+    def tile_changed(self, position):
+        """
+        Called when the tile at position is replaced, to refresh the pre-rendered background
+        """
+        self.hardness_grid.tile_changed(position)
+        if isinstance(self.background_regions, TileRegions):
+            self.background_regions.invalidate_position(position)
+        if self.controller.pathfinder is not None:
+            self.controller.pathfinder.tile_changed(position)
+        for field in self.controller.flow_fields.values():
+            field.tile_changed(position)
+        self.controller.dirty_tiles[position[0] - self.left, position[1] - self.top] = True
+
+    def _tile_name(self, position):
+        if self.chunk_loader is not None:
+            index = self.chunk_loader.tile_index(position)
+        else:
+            index = int(self.tile_grid[position[0], position[1]])
+        return self.palette.name_at(index) if index >= 0 else None
 
     def _raw_getitem(self, position):
-        try:
-            color = self.image.get_at(position)
-        except IndexError:
-            return self.out_of_map
-        try:
-            name = self.palette[color]
-        except KeyError:
-            return color
+        return self._lookup(position)[0]
+
+    def _lookup(self, position):
+        """
+        Returns the tile at position, and whether it is shared by all
+        map cells with the same palette color.
+
+        background_plane only caches the tiles that are particular to a map cell -
+        GameObjects that keep state and colors not in the palette. Colors, images
+        and "shared" GameObjects are looked up in the tile index grid each time.
+        """
+        if self.tile_grid is None and self.chunk_loader is None:
+            # No tile index grid: everything is cached, to avoid reading pixels again
+            try:
+                color = self.image.get_at(position)
+            except IndexError:
+                return self.out_of_map, False
+            name = self.palette.name_for(color)
+            if name is None:
+                return color, False
+            return self._tile_for_name(name, color, position), False
+        if not (0 <= position[0] < self.width and 0 <= position[1] < self.height):
+            return self.out_of_map, True
+        name = self._tile_name(position)
+        if name is None:
+            return self._unmapped_color(position), False
+        tile = self._tile_for_name(name, self.palette[name], position)
+        return tile, tile is self.tiles[name]
+
+    def _unmapped_color(self, position):
+        if self.chunk_loader is not None:
+            return Color(self.chunk_loader.color_at(position))
+        if self.image is None:
+            # scene loaded from a compiled bundle
+            return Color(int(self.color_grid[position[0], position[1]]))
+        return self.image.get_at(position)
+
+    def _tile_for_name(self, name, color, position):
         if name in self.tiles:
             if isinstance(self.tiles[name], type):
                 return self.tiles[name](self.controller, position)
             else:
                 return self.tiles[name]
         if name.lower() in GameObjectClasses:
-            self.tiles[name] = GameObjectClasses[name.lower()]
+            cls = GameObjectClasses[name.lower()]
+            if cls.shared:
+                # flyweight: a single instance for all cells with this tile
+                self.tiles[name] = cls(self.controller, position)
+                return self.tiles[name]
+            self.tiles[name] = cls
             return self.tiles[name](self.controller, position)
 
-        img = self.image_load(name)
+        img = None if self.controller.headless else self.image_load(name)
         if img is None:
             self.tiles[name] = color
         else:
             if img.get_width() != self.blocksize:
-                ratio = float(self.blocksize) / img.get_width()
-                img = pygame.transform.rotozoom(img, 0, ratio)
+                img = prepare_surface(self.scaled_tile(img, self.blocksize), rle=True)
             self.tiles[name] = img
         return self.tiles[name]
 
+    @staticmethod
+    def scaled_tile(image, blocksize):
+        if image.get_width() == blocksize:
+            return image
+        ratio = float(blocksize) / image.get_width()
+        return pygame.transform.rotozoom(image, 0, ratio)
+
     def __delitem__(self, position):
-        del self.background_plane[position]
+        self.background_plane.pop(position, None)
+        self.tile_changed(position)
 
     def get_actor_at(self, position):
         """
         At scene load all positions are scanned for actor instantiation.
         This is called by the controller automatically for each position on the map.
         """
+        if self.chunk_loader is not None:
+            if not (0 <= position[0] < self.width and 0 <= position[1] < self.height):
+                return None
+            index = self.chunk_loader.actor_index(position)
+            return GameObjectClasses.get(self.palette.name_at(index), None) if index >= 0 else None
+        if self.actor_grid is not None:
+            if not self._in_grid(self.actor_grid, position):
+                return None
+            index = int(self.actor_grid[position[0], position[1]])
+            if index < 0:
+                return None
+            return GameObjectClasses.get(self.palette.name_at(index), None)
         try:
             color = self.actor_plane.get_at(position)
         except IndexError:
@@ -488,12 +1168,45 @@ class Scene(object):
         if color[3] == 0:
             return None
         # TODO: load scene block images
-        try:
-            name = self.palette[color]
-        except KeyError:
-            # Unregistered actor
-            return None
-        return GameObjectClasses.get(name, None)
+        # (colors not in the palette are unregistered actors)
+        return GameObjectClasses.get(self.palette.name_for(color), None)
+
+    def iter_actor_spawns(self):
+        """
+        Yields (position, actor class) for each actor on the actor plane,
+        scanning columns first, in the same order the per-position lookup does.
+
+        For chunked scenes, only the main character and the actors in the
+        chunks around the view are spawned.
+        """
+        if self.chunk_loader is not None:
+            for pos, index in self.chunk_loader.spawns_of(self._main_character_indexes()):
+                yield pos, GameObjectClasses[self.palette.name_at(index)]
+            controller = self.controller
+            activated, _ = self.chunk_loader.update(self.left, self.top, controller.blocks_x, controller.blocks_y)
+            for key in activated:
+                self.chunk_loader.spawned.add(key)
+                for spawn in self._chunk_spawns(key):
+                    yield spawn
+            return
+        if self.actor_spawns is not None:
+            for pos, index in self.actor_spawns:
+                cls = GameObjectClasses.get(self.palette.name_at(index), None)
+                if cls:
+                    yield pos, cls
+            return
+        if self.actor_grid is None:
+            for x in range(self.width):
+                for y in range(self.height):
+                    cls = self.get_actor_at((x, y))
+                    if cls:
+                        yield (x, y), cls
+            return
+        grid = self.actor_grid[:self.width, :self.height]
+        for x, y in numpy.argwhere(grid >= 0).tolist():
+            cls = GameObjectClasses.get(self.palette.name_at(grid[x, y]), None)
+            if cls:
+                yield (x, y), cls
 
     def move(self, direction):
         self.target_left += direction[0]
@@ -524,26 +1237,10 @@ class Scene(object):
             self.left += 1
         elif self.left > self.target_left:
             self.left -= 1
+        if self.chunk_loader is not None:
+            self.update_chunks()
 
 
-GameObjectClasses = {}
-
-
-class GameObjectRegistry(type):
-    def __new__(metacls, name, bases, dct):
-        cls = type.__new__(metacls, name, bases, dct)
-        GameObjectClasses[name.lower()] = cls
-        return cls
-
-class Event(object):
-    def __init__(self, countdown, attribute, value):
-        self.countdown = countdown
-        self.attribute = attribute
-        self.value = value
-
-    def __hash__(self):
-        return hash(self.attribute)
-
 TEXT_WIDTH = 20
 
 class Blob(Sprite, FontLoader):
@@ -577,11 +1274,20 @@ class Blob(Sprite, FontLoader):
     def render(self):
         if self.rendered_message == self.message:
             return self.image
+        key = self.text_key(
+            self.width, self.color_key(self.background), self.margin, self.frame,
+            self.line_spacing, self.justification, self.message
+        )
+        self.image = text_cache.get(key, self.compose)
+        self.rendered_message = self.message
+        return self.image
+
+    def compose(self):
         max_width = 0
         total_height = 0
         rendered_lines = []
         for line in textwrap.wrap(self.message, self.width):
-            rendered_line = self.font.render(line, self.antialias, self.color)
+            rendered_line = self.render_line(line)
             rendered_lines.append(rendered_line)
             max_width = max(max_width, rendered_line.get_width())
             total_height += rendered_line.get_height() + self.line_spacing
@@ -607,9 +1313,6 @@ class Blob(Sprite, FontLoader):
                 ),
                 self.frame
             )
-
-        self.image = image
-        self.rendered_message = self.message
         return image
 
     def kill(self):
@@ -628,21 +1331,29 @@ class GameObject(Sprite, metaclass=GameObjectRegistry):
                           # in each row is used for stopped character - others
                           # are used by character when in movement
     image_name = None
+    # Sprite sheet frames, by (image_sequence, blocksize, resize)
     image_cache = {}
+    # Prepared images - already scaled and flipped - shared by all
+    # instances of a class, by (class, image name or sequence, blocksize)
+    animation_sets = {}
     base_image = image = None
     auto_flip = False
     off_screen_update = False
+    # Set "shared" to True for stateless map tiles: a single instance is then used
+    # for every cell of the map with this tile - so it should not depend on its "pos"
+    shared = False
 
     def __init__(self, controller, pos=(0,0)):
         self.messages = Group()
         self.controller = controller
-        self.old_pos = self.pos = V(pos)
+        # not in the actors index yet: no need to go through the "pos" setter
+        self.old_pos = self._pos = V(pos)
         self.images = {}
         if not self.image_sequence:
             self.image_load(self.image_name or self.__class__.__name__.lower())
         else:
             self.auto_image_sequence_load(self.image_sequence)
-        self.events = set()
+        self.events = ObjectEvents(self, controller.scheduler)
         self.tick = 0
         super(GameObject, self).__init__()
         self.move_direction = Directions.RIGHT
@@ -652,11 +1363,26 @@ class GameObject(Sprite, metaclass=GameObjectRegistry):
         self.message_queue = []
         self.update()
 
+    @property
+    def pos(self):
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        old_pos = self._pos
+        self._pos = pos if isinstance(pos, Vector) else V(pos)
+        # keeps the controller's actors index up to date, whether the
+        # position comes from "move" or is assigned by the game
+        controller = self.controller
+        controller.actor_index.move(self)
+        if controller.scene.chunk_loader is not None:
+            controller.scene.actor_moved(self, old_pos)
+
     def _resize(self, img):
         img_size = self.controller.scene.blocksize
         ratio = float(img_size) / max(img.get_size())
         img = pygame.transform.rotozoom(img, 0, ratio)
-        return img
+        return prepare_surface(img, rle=True)
 
     def raw_image_load(self, name, resize=True):
         scene = self.controller.scene
@@ -666,39 +1392,74 @@ class GameObject(Sprite, metaclass=GameObjectRegistry):
             color = scene.palette[self.__class__.__name__]
             img = pygame.Surface((img_size, img_size), pygame.SRCALPHA)
             img.fill(color)
+            img = prepare_surface(img)
         if resize and img_size != max(img.get_size()):
             img = self._resize(img)
         return img
 
+    def shared_images(self, key, build):
+        """
+        Returns the images prepared by build() for this class, image key and the
+        scene blocksize - build is only called for the first instance.
+        """
+        key = (self.__class__, key, self.controller.scene.blocksize)
+        try:
+            return self.animation_sets[key]
+        except KeyError:
+            images = self.animation_sets[key] = build()
+            return images
+
     def image_load(self, name):
-        self.base_image = img = self.raw_image_load(name)
-        if self.auto_flip:
-            self.images["up"] = self.images["right"] = [img]
-            self.images["down"] = self.images["left"] = [pygame.transform.flip(img, True, False)]
-        if self.background_image:
-            img = self.raw_image_load(self.background_image)
-            img.blit(self.base_image, (0,0))
-        self.image = img
+        if self.controller.headless:
+            return
+
+        def build():
+            base_image = self.raw_image_load(name)
+            images = {"base": base_image, "image": base_image}
+            if self.auto_flip:
+                images["up"] = images["right"] = [base_image]
+                images["down"] = images["left"] = [prepare_surface(pygame.transform.flip(base_image, True, False), rle=True)]
+            if self.background_image:
+                # copy: the loaded image is cached by the scene
+                image = images["image"] = self.raw_image_load(self.background_image).copy()
+                image.blit(base_image, (0,0))
+            return images
+
+        images = self.shared_images(("image", name, self.auto_flip, self.background_image), build)
+        self.base_image = images["base"]
+        for direction in ("up", "right", "down", "left"):
+            if direction in images:
+                self.images[direction] = images[direction]
+        self.image = images["image"]
 
     def image_sequence_load(self, image_sequence, resize=True):
-        if image_sequence in self.__class__.image_cache:
-            return self.__class__.image_cache[image_sequence]
+        blocksize = self.controller.scene.blocksize
+        key = (image_sequence, blocksize, resize)
+        if key in self.image_cache:
+            return self.image_cache[key]
         filename = image_sequence[0]
         img = self.raw_image_load(filename, resize=False)
         width = image_sequence[1]
         height = image_sequence[2] if len(image_sequence) > 2 else img.get_height()
+        sheet_rect = img.get_rect()
 
         imgs = []
         for offset_y in range(0, img.get_height(), height):
             strip = []
             for offset_x in range(0, img.get_width(), width):
-                new_img = pygame.Surface((width, height), pygame.SRCALPHA)
-                new_img.blit(img, (0, 0), (offset_x, offset_y, width, height))
-                if resize:
+                area = pygame.Rect(offset_x, offset_y, width, height)
+                if sheet_rect.contains(area):
+                    # a view into the sprite sheet: no pixels are copied
+                    new_img = img.subsurface(area)
+                else:
+                    new_img = pygame.Surface((width, height), pygame.SRCALPHA)
+                    new_img.blit(img, (0, 0), area)
+                    new_img = prepare_surface(new_img)
+                if resize and max(width, height) != blocksize:
                     new_img = self._resize(new_img)
                 strip.append(new_img)
             imgs.append(strip)
-        self.__class__.image_cache[image_sequence] = imgs
+        self.image_cache[key] = imgs
         return imgs
 
 
@@ -716,22 +1477,34 @@ class GameObject(Sprite, metaclass=GameObjectRegistry):
         The given file_sequence is stored in self.images[<key>]  where <key> is 
         <right/left/up/down>[_name]
         (ex. "right_jump")
+        The frames are shared by all instances of the class.
         """
+        if self.controller.headless:
+            return
         if 2 <= len(file_sequence) <= 3 and isinstance(file_sequence[0], str):
             file_sequence = [file_sequence]
-        sequences = []
-        for part in file_sequence:
-            sequences.extend(self.image_sequence_load(tuple(part)))
+        file_sequence = tuple(tuple(part) for part in file_sequence)
+
+        def build():
+            sequences = []
+            for part in file_sequence:
+                sequences.extend(self.image_sequence_load(part))
+            right_images = sequences[0]
+            left_images = [prepare_surface(pygame.transform.flip(img, True, False), rle=True) for img in sequences[0]]
+            return {
+                "right": right_images,
+                "left": left_images,
+                "up": sequences[1] if len(sequences) > 1 else right_images,
+                "down": sequences[2] if len(sequences) > 2 else left_images,
+            }
+
+        images = self.shared_images(("sequence", file_sequence), build)
         key_base = "{{}}_{}".format(name) if name else "{}"
-        right_images = self.images[key_base.format("right")] = sequences[0]
-        left_images = self.images[key_base.format("left")] = [pygame.transform.flip(img, True, False) for img in sequences[0]]
-
-        self.images[key_base.format("up")] = sequences[1] if len(sequences) > 1 else right_images
-        self.images[key_base.format("down")] = sequences[2] if len(sequences) > 2 else left_images
+        for direction, frames in images.items():
+            self.images[key_base.format(direction)] = frames
 
 
     def update(self):
-        self.process_events()
         bl = self.controller.scene.blocksize
         # location rectangle, in pixels, relative to the scene (not the screen)
         self.rect = pygame.Rect([self.pos[0] * bl, self.pos[1] * bl, bl, bl])
@@ -755,21 +1528,6 @@ class GameObject(Sprite, metaclass=GameObjectRegistry):
             self.show_text()
         return super(GameObject, self).update()
 
-    def process_events(self):
-        for event in list(self.events):
-            if event.countdown >= 0:
-                event.countdown -= 1
-                continue
-            if callable(event.attribute):
-                if event.value is None:
-                    args = []
-                elif not isinstance(event.value, list):
-                    args = [event.value]
-                event.attribute(*args)
-            else:
-                setattr(self, event.attribute, event.value)
-            self.events.remove(event)
-
     def on_over(self, other):
         """
         Override this to create a behavior when object is touched by another one
@@ -782,6 +1540,14 @@ class GameObject(Sprite, metaclass=GameObjectRegistry):
         """
         pass
 
+    @classmethod
+    def needs_tile_object(cls):
+        """
+        Whether map cells with this tile have to be read from their tile object:
+        tiles that are not shared may change, and touching a tile runs on_touch
+        """
+        return not cls.shared or cls.on_touch is not GameObject.on_touch
+
     def on_fire(self):
         for message in self.controller.messages:
             message.kill()
@@ -805,9 +1571,18 @@ class GameObject(Sprite, metaclass=GameObjectRegistry):
         
 
     def kill(self):
+        self.detach()
+
+    def detach(self):
+        """
+        Takes the object out of the game - groups, actors index, pending
+        events and messages - with none of the game effects "kill" may have
+        """
         for message in self.messages:
             message.kill()
-        return super(GameObject, self).kill()
+        self.events.clear()
+        self.controller.actor_index.remove(self)
+        Sprite.kill(self)
 
 
 class Actor(GameObject):
@@ -816,6 +1591,10 @@ class Actor(GameObject):
     base_move_rate = 4
     blinking = False
     auto_flip = True
+    # positions still to walk through, when going somewhere with "go_to":
+    path = None
+    # frames to wait for a blocked path to clear before looking for another way:
+    path_patience = 30
 
     def __init__(self, *args, **kw):
         # self.pos = kw.pop("pos", (0,0))
@@ -827,23 +1606,82 @@ class Actor(GameObject):
         if self.move_counter < self.base_move_rate:
             return
         self.old_pos = self.pos
-        new_pos = self.pos + direction
+        x = self.pos[0] + direction[0]
+        y = self.pos[1] + direction[1]
         scene = self.controller.scene
-        if new_pos.x < 0 or new_pos.x > scene.width or new_pos.y < 0 or new_pos.y > scene.height:
+        if x < 0 or x > scene.width or y < 0 or y > scene.height:
             return
         self.move_direction = direction
         self.move_direction_count = self.tick
         self.speed = 1.0 / self.base_move_rate 
-        other_obj = self.controller[new_pos]
-        if isinstance(other_obj , GameObject):
-            self.controller[new_pos].on_touch(self)
-        if getattr(other_obj, "hardness", 0) > self.strength:
+        # Tiles are only looked up if they have to be touched:
+        # otherwise, the scene hardness grid is enough
+        other_obj = self.controller.actor_index.at((x, y))
+        if other_obj is None and scene.hardness_grid.is_object(x, y):
+            other_obj = scene[x, y]
+        if other_obj is None:
+            hardness = scene.hardness_grid.class_hardness(x, y)
+        else:
+            if isinstance(other_obj , GameObject):
+                other_obj.on_touch(self)
+            hardness = getattr(other_obj, "hardness", 0)
+        if hardness > self.strength:
             return
-        self.pos = new_pos
+        self.pos = V((x, y))
         self.move_counter = 0
 
+    def go_to(self, target):
+        """
+        Walks to target, one move at a time, along the shortest way for
+        the actor strength. Returns False if target can't be reached -
+        an actor already at target has on_arrival called right away.
+        """
+        path = self.controller.find_path(self.pos, target, self.strength)
+        self.path = deque(path) if path else None
+        self.path_blocked = 0
+        if path == []:
+            self.on_arrival()
+        return path is not None
+
+    def follow_path(self):
+        if self.move_counter < self.base_move_rate:
+            return
+        next_pos = self.path[0]
+        self.move((next_pos[0] - self.pos[0], next_pos[1] - self.pos[1]))
+        if self.pos == next_pos:
+            self.path.popleft()
+            self.path_blocked = 0
+            if not self.path:
+                self.path = None
+                self.on_arrival()
+            return
+        self.path_blocked += 1
+        if self.path_blocked >= self.path_patience:
+            self.go_to(self.path[-1])
+
+    def on_arrival(self):
+        """
+        Called when a "go_to" target is reached
+        """
+
+    def chase(self, target=None):
+        """
+        Moves towards target - by default, the main character - along the controller
+        flow field for the actor strength. Returns False if target can't be reached.
+        To chase another actor, pass the actor itself, rather than its position:
+        its field then follows it.
+        """
+        field = self.controller.flow_field(self.strength, target)
+        direction = field.direction(self.pos)
+        if direction is None:
+            return field.distance(self.pos) == 0
+        self.move(direction)
+        return True
+
     def update(self):
         super(Actor, self).update()
+        if self.path:
+            self.follow_path()
         if self.blinking and self.tick % 2:
             self.image = None
         else:
@@ -867,13 +1705,82 @@ class FallingActor(Actor):
 
     def update(self):
         super(FallingActor, self).update()
-        if getattr(self.controller[self.pos[0] + self.gravity[0], self.pos[1] + self.gravity[1]], "hardness", 0) < self.weight:
+        if self.controller.hardness_at((self.pos[0] + self.gravity[0], self.pos[1] + self.gravity[1])) < self.weight:
             self.move(self.gravity)
             # if self.pos > self.controller.scene.height:
             #    self.kill()
 
 
-def simpleloop(scene, size, godmode=False):
+def handle_keys(controller, scene, godmode=False):
+    keys = pygame.key.get_pressed()
+    if keys[pygame.K_ESCAPE]:
+        raise GameOver
+    main_character = (controller.protagonist) if not godmode else None
+    for direction_name in "RIGHT LEFT UP DOWN".split():
+        if keys[getattr(pygame, "K_" + direction_name)]:
+            direction = getattr(Directions, direction_name)
+            if godmode:
+                scene.move(direction)
+            else:
+                main_character.move(direction)
+        if keys[pygame.K_SPACE] and not godmode:
+            main_character.on_fire()
+
+
+def fixed_step_frames(controller, scene, godmode=False, tick_rate=None, max_frame_skip=5, max_frame_rate=60):
+    """
+    Runs the game with a simulation at a fixed rate of "tick_rate" ticks per second
+    (by default, one tick each FRAME_DELAY milliseconds), drawing frames in between
+    as often as possible, up to "max_frame_rate".
+
+    When the game can't keep up, frames are skipped - never ticks - but
+    a frame is always drawn after "max_frame_skip" ticks in a row.
+    """
+    tick_length = 1.0 / tick_rate if tick_rate else FRAME_DELAY / 1000.0
+    frame_length = 1.0 / max_frame_rate if max_frame_rate else 0
+    previous = last_frame = clock()
+    lag = 0.0
+    while True:
+        pygame.event.pump()
+        if controller.inside_cut:
+            controller.update()
+            previous = clock()
+            lag = 0.0
+            continue
+        now = clock()
+        lag += now - previous
+        previous = now
+        ticks = 0
+        while lag >= tick_length and ticks < max_frame_skip:
+            handle_keys(controller, scene, godmode)
+            if not controller.step() or controller.inside_cut:
+                lag = 0.0
+                break
+            lag -= tick_length
+            ticks += 1
+        if controller.inside_cut:
+            continue
+        if ticks or now - last_frame >= frame_length:
+            last_frame = now
+            controller.draw(alpha=min(1.0, lag / tick_length))
+            controller.present()
+        if controller.profiler is not None:
+            # time spent in this pass of the loop, but for sleeping
+            controller.profiler.add("frame", clock() - now)
+        # Sleep until the next tick or frame is due
+        delay = min(tick_length - lag, frame_length - (clock() - last_frame))
+        if delay > 0:
+            pygame.time.delay(int(delay * 1000))
+
+
+def simpleloop(scene, size, godmode=False, fixed_step=False, **kw):
+    """
+    Runs a game from the given scene.
+
+    With "fixed_step", the simulation and drawing are decoupled, and the
+    game speed does not depend on the speed at which frames can be drawn:
+    see "fixed_step_frames" for the extra keyword arguments.
+    """
     controller = Controller(size, scene)
 
     try:
@@ -881,30 +1788,21 @@ def simpleloop(scene, size, godmode=False):
         continue_ = True
         while continue_:
             try:
+                if fixed_step:
+                    fixed_step_frames(controller, scene, godmode, **kw)
                 while True:
                     frame_start = pygame.time.get_ticks()
+                    frame_clock = clock()
                     pygame.event.pump()
                     controller.update()
                     if controller.inside_cut:
                         continue
-                    pygame.display.flip()
+                    controller.present()
+                    if controller.profiler is not None:
+                        controller.profiler.add("frame", clock() - frame_clock)
                     delay = max(0, FRAME_DELAY - (pygame.time.get_ticks() - frame_start))
                     pygame.time.delay(delay)
-
-                    keys = pygame.key.get_pressed()
-                    if keys[pygame.K_ESCAPE]:
-                        raise GameOver
-                    main_character = (controller.protagonist) if not godmode else None
-                    for direction_name in "RIGHT LEFT UP DOWN".split():
-                        if keys[getattr(pygame, "K_" + direction_name)]:
-                            direction = getattr(Directions, direction_name)
-                            if godmode:
-                                scene.move(direction)
-                            else:
-                                main_character.move(direction)
-                        if keys[pygame.K_SPACE] and not godmode:
-                            main_character.on_fire()
-
+                    handle_keys(controller, scene, godmode)
 
             except GameOver:
                 continue_ = False
@@ -952,9 +1850,12 @@ class MainActor(Actor):
 
 class Brick(GameObject):
     hardness = 5
+    shared = True
 
 
 class Wood(GameObject):
+    shared = True
+
     def on_touch(self, other):
         # Example: raise the Hero strength when wood is touched
         other.strength = 6
@@ -0,0 +1,606 @@
+# coding: utf-8
+"""
+Benchmarks for mapengine, on synthetic scenes.
+
+Run with:
+
+    python -m mapengine.bench [--size 256] [--output results.json] [--compare old.json]
+
+A scene with the given size, tile variety and actor density is generated
+in a temporary directory (map and actor PNGs, GIMP palette and tile images),
+and scene loading, per-frame updates, drawing, scrolling, image blits and vector operations are timed under
+the SDL "dummy" video driver - so it runs on machines with no display.
+Drawing is also timed with the tiles drawn block by block and from pre-rendered
+chunks, for the window and block size given, and the memory taken by the tiles
+of the whole map is measured.
+Scenes are generated from a fixed random seed: results of two runs with the
+same options can be compared with "--compare".
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+# Must be set before pygame initializes the display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .base import Controller, Scene, Actor, GameObject, add_scene_path
+from .render import prepare_surface
+from . import utils
+from .utils import Vector
+
+BENCH_VERSION = 1
+SCENE_NAME = "benchscene"
+
+
+class Benchwall(GameObject):
+    hardness = 5
+    shared = True
+
+
+class Benchwalker(Actor):
+    """
+    Wanders around in a pattern fixed by its starting position
+    """
+    off_screen_update = True
+    move_rate = 6
+    directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+    rng = None
+
+    def update(self):
+        if self.rng is None:
+            self.rng = random.Random(self.pos[0] * 7919 + self.pos[1])
+        if not self.tick % self.move_rate:
+            self.move(self.rng.choice(self.directions))
+        super(Benchwalker, self).update()
+
+
+class Benchhero(Benchwalker):
+    main_character = True
+
+
+class Benchchaser(Actor):
+    """
+    Follows the main character along the controller flow field
+    """
+    off_screen_update = True
+
+    def update(self):
+        self.chase()
+        super(Benchchaser, self).update()
+
+
+def generate_scene(directory, size=256, tiles=6, density=2.0, wall_ratio=0.1, seed=0):
+    """
+    Writes a synthetic scene of size x size blocks to directory. "tiles" plain
+    tile kinds - half of them with images - are mixed with "wall_ratio" walls,
+    and there are "density" walking actors per 100 blocks.
+    """
+    rng = random.Random(seed)
+    palette = []
+    for index in range(tiles):
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(0, 256, 2))
+        palette.append((color, "benchtile{}".format(index)))
+        if index % 2:
+            image = pygame.Surface((32, 32))
+            image.fill(color)
+            pygame.draw.circle(image, (255 - color[0], 255 - color[1], 255 - color[2]), (16, 16), 10)
+            pygame.image.save(image, os.path.join(directory, "benchtile{}.png".format(index)))
+    # odd blue components are reserved for the class tiles, so that colors never repeat
+    wall_color = (90, 90, 91)
+    walker_color = (255, 255, 1)
+    palette.append((wall_color, "benchwall"))
+    palette.append((walker_color, "benchwalker"))
+    # not on the map: the chase benchmark places these actors itself
+    palette.append(((255, 0, 1), "benchhero"))
+    palette.append(((0, 255, 1), "benchchaser"))
+
+    with open(os.path.join(directory, SCENE_NAME + ".gpl"), "w") as file_:
+        file_.write("GIMP Palette\nName: {}\n#\n".format(SCENE_NAME))
+        for (r, g, b), name in palette:
+            file_.write("{} {} {} {}\n".format(r, g, b, name))
+
+    tile_colors = [color for color, name in palette[:tiles]]
+    plane = pygame.Surface((size, size))
+    actors = pygame.Surface((size, size), pygame.SRCALPHA)
+    actors.fill((0, 0, 0, 0))
+    for x in range(size):
+        for y in range(size):
+            if rng.random() < wall_ratio:
+                plane.set_at((x, y), wall_color)
+            else:
+                plane.set_at((x, y), rng.choice(tile_colors))
+            if rng.random() < density / 100.0:
+                actors.set_at((x, y), walker_color)
+    pygame.image.save(plane, os.path.join(directory, SCENE_NAME + ".png"))
+    pygame.image.save(actors, os.path.join(directory, SCENE_NAME + "_actors.png"))
+
+
+class BenchController(Controller):
+    def load_initial_actors(self):
+        start = time.perf_counter()
+        super(BenchController, self).load_initial_actors()
+        self.actors_load_time = time.perf_counter() - start
+
+
+def summary(times):
+    """
+    Statistics, in milliseconds, of a list of durations in seconds
+    """
+    times = sorted(times)
+    count = len(times)
+    return {
+        "mean": 1000 * sum(times) / count,
+        "median": 1000 * times[count // 2],
+        "p95": 1000 * times[min(count - 1, int(count * 0.95))],
+        "min": 1000 * times[0],
+        "max": 1000 * times[-1],
+    }
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return summary(times)
+
+
+def vectors(controller, frames):
+    """
+    Counts the Vectors created per frame by the game updates and drawing,
+    and times basic vector operations, in nanoseconds.
+    """
+    created = [0]
+    new_tuple = utils._new_tuple
+
+    def counting(cls, values):
+        created[0] += 1
+        return new_tuple(cls, values)
+
+    # every Vector, built directly or by arithmetic, goes through _new_tuple
+    utils._new_tuple = counting
+    try:
+        for _ in range(frames):
+            controller.step()
+            controller.draw()
+            controller.present()
+    finally:
+        utils._new_tuple = new_tuple
+
+    names = {"a": Vector((3, 4)), "b": Vector((1, 2)), "Vector": Vector}
+    names["positions"] = {names["a"]: True}
+
+    def nanoseconds(statement, number=100000):
+        return 1e9 * min(timeit.repeat(statement, globals=names, number=number, repeat=3)) / number
+
+    return {
+        "per_frame": float(created[0]) / frames,
+        "new_ns": nanoseconds("Vector((3, 4))"),
+        "add_ns": nanoseconds("a + b"),
+        "lookup_ns": nanoseconds("positions[(3, 4)]"),
+        "compare_ns": nanoseconds("a == b"),
+    }
+
+
+def rendering(window, scene_options, frames, chunk_size=16):
+    """
+    Times drawing frames with nothing changed ("static"), whole screen redraws
+    ("full") and scrolls of a block ("scroll"), for the map tiles drawn one by one
+    (render_chunk_size 0, "blocks") and from pre-rendered chunks ("chunks").
+    Each runs on a scene of its own, with no actors. Scrolls include building
+    the chunks as they come into view.
+    """
+    results = {}
+    moves = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+    for name, render_chunk_size in (("blocks", 0), ("chunks", chunk_size)):
+        scene = Scene(SCENE_NAME, **dict(scene_options, render_chunk_size=render_chunk_size))
+        controller = BenchController(window, scene)
+        for actor in list(controller.all_actors):
+            actor.kill()
+        scene.left = (scene.width - controller.blocks_x) // 2
+        scene.top = (scene.height - controller.blocks_y) // 2
+        state = {"frame": 0}
+
+        def draw():
+            controller.draw()
+            controller.present()
+
+        def full():
+            controller.force_redraw = True
+            draw()
+
+        def scroll():
+            # one block each frame, in a different direction every 8 frames
+            direction = moves[(state["frame"] // 8) % len(moves)]
+            scene.left += direction[0]
+            scene.top += direction[1]
+            state["frame"] += 1
+            draw()
+
+        draw()
+        results[name] = {
+            "static": timed(draw, frames),
+            "full": timed(full, frames),
+            "scroll": timed(scroll, frames),
+        }
+    return results
+
+
+def blits(controller, count=10000):
+    """
+    Blits per second to the screen of tile and sprite images as decoded from
+    PNG files ("raw") - RGB, and RGBA with per-pixel alpha - and after
+    prepare_surface converted them to the display format ("prepared").
+    """
+    screen = controller.screen
+    blocksize = controller.scene.blocksize
+    tile = pygame.Surface((blocksize, blocksize))
+    tile.fill((30, 120, 60))
+    pygame.draw.circle(tile, (225, 135, 195), (blocksize // 2, blocksize // 2), blocksize // 3)
+    sprite = pygame.Surface((blocksize, blocksize), pygame.SRCALPHA)
+    pygame.draw.circle(sprite, (200, 40, 40, 255), (blocksize // 2, blocksize // 2), blocksize // 2 - 1)
+    # the pixel layouts image.load gives for PNG files
+    raw_tile = pygame.image.frombytes(pygame.image.tobytes(tile, "RGB"), tile.get_size(), "RGB")
+    raw_sprite = pygame.image.frombytes(pygame.image.tobytes(sprite, "RGBA"), sprite.get_size(), "RGBA")
+    rng = random.Random(0)
+    positions = [
+        (rng.randrange(controller.width - blocksize), rng.randrange(controller.height - blocksize))
+        for _ in range(count)
+    ]
+
+    def rate(image):
+        def blit_all():
+            for position in positions:
+                screen.blit(image, position)
+        return count / min(timeit.repeat(blit_all, number=1, repeat=3))
+
+    return {
+        "tiles_raw_per_s": rate(raw_tile),
+        "tiles_prepared_per_s": rate(prepare_surface(raw_tile, rle=True)),
+        "sprites_raw_per_s": rate(raw_sprite),
+        "sprites_prepared_per_s": rate(prepare_surface(raw_sprite, rle=True)),
+    }
+
+
+def tile_memory(scene):
+    """
+    Memory held - in MB, traced with tracemalloc - after looking up the tile of
+    every cell of the map, and the time the lookups take under tracing, in ms.
+    Only the tiles particular to a cell are kept by the scene (see GameObject.shared).
+    """
+    scene.background_plane.clear()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for x in range(scene.width):
+            for y in range(scene.height):
+                scene[x, y]
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "memory_mb": (current - before) / 2.0 ** 20,
+        "peak_mb": (peak - before) / 2.0 ** 20,
+        "time": 1000 * elapsed,
+        "cell_tiles": len(scene.background_plane),
+    }
+
+
+def chase(controller, count, frames, seed=0):
+    """
+    Replaces the scene actors by "count" actors chasing a wandering main character,
+    and times the flow field computation, its repair when the target moves
+    a block, and the game updates.
+    """
+    from .flowfield import tile_hardness, padded_distances, direction_field, repair_distances, repair_directions
+    rng = random.Random(seed)
+    for actor in list(controller.all_actors):
+        actor.kill()
+    passable = tile_hardness(controller.scene) <= Benchchaser.strength
+    cells = [tuple(cell) for cell in numpy.argwhere(passable).tolist()]
+    # counted from before the chasers first ask for it
+    flow_field = controller.flow_field(Benchchaser.strength)
+    computed, repaired = flow_field.computed, flow_field.repaired
+    hero = controller.spawn_actor(Benchhero, cells[len(cells) // 2])
+    for cell in rng.sample(cells, count):
+        controller.spawn_actor(Benchchaser, cell)
+
+    def field():
+        direction_field(padded_distances(passable, [tuple(hero.pos)])[1:-1, 1:-1])
+
+    state = {"target": tuple(hero.pos)}
+    padded = padded_distances(passable, [state["target"]])
+    directions = direction_field(padded[1:-1, 1:-1])
+    width, height = passable.shape
+
+    def repair():
+        # the target wanders to a random passable neighbouring cell
+        x, y = state["target"]
+        steps = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+        rng.shuffle(steps)
+        for dx, dy in steps:
+            if 0 <= x + dx < width and 0 <= y + dy < height and passable[x + dx, y + dy]:
+                state["target"] = (x + dx, y + dy)
+                break
+        else:
+            return
+        closer = repair_distances(padded, state["target"])
+        repair_directions(directions, padded, closer)
+
+    results = {
+        "field": timed(field, 10),
+        "repair": timed(repair, 10),
+        "update": timed(controller.step, frames),
+        "actor_count": len(controller.all_actors),
+    }
+    results["fields_computed"] = flow_field.computed - computed
+    results["fields_repaired"] = flow_field.repaired - repaired
+    return results
+
+
+def pathfinding(controller, count, seed=0):
+    """
+    Times "count" controller.find_path queries between random cells - which also
+    build the clusters they cross - then as many between other cells of the same
+    clusters, which reuse the routes found by the first ones, and checks every
+    path found: each step to a passable neighbouring cell, ending at the goal.
+    """
+    rng = random.Random(seed)
+    strength = Benchchaser.strength
+    scene = controller.scene
+    controller.find_path((0, 0), (0, 0), strength)
+    finder = controller.pathfinder
+
+    def free_cell(cluster=None):
+        while True:
+            if cluster is None:
+                cell = (rng.randrange(scene.width), rng.randrange(scene.height))
+            else:
+                x0, y0, x1, y1 = finder.cluster_bounds(cluster)
+                # border cells - where reused routes start and end - half of the time
+                xs = [x0, x1 - 1] if rng.random() < 0.5 else range(x0, x1)
+                cell = (rng.choice(xs), rng.randrange(y0, y1))
+            if finder.passable(cell, strength):
+                return cell
+
+    def valid(start, goal, path):
+        previous = start
+        for cell in path:
+            if abs(cell[0] - previous[0]) + abs(cell[1] - previous[1]) != 1:
+                return False
+            if not finder.passable(cell, strength):
+                return False
+            previous = cell
+        return previous == goal
+
+    results = {"invalid": 0, "unreachable": 0}
+
+    def queries(pairs):
+        times = []
+        for start, goal in pairs:
+            begin = time.perf_counter()
+            path = controller.find_path(start, goal, strength)
+            times.append(time.perf_counter() - begin)
+            if path is None:
+                results["unreachable"] += 1
+            elif not valid(start, goal, path):
+                results["invalid"] += 1
+        return summary(times)
+
+    pairs = [(free_cell(), free_cell()) for _ in range(count)]
+    results["new"] = queries(pairs)
+    results["reused"] = queries([
+        (free_cell(finder.cluster_of(start)), free_cell(finder.cluster_of(goal)))
+        for start, goal in pairs
+    ])
+    return results
+
+
+def run(size=256, tiles=6, density=2.0, frames=100, seed=0, scene_options=None, directory=None, chasers=0, paths=0,
+        walls=None, unshared_walls=False, window=(800, 600), blocksize=None):
+    """
+    Runs all benchmarks, returning a dictionary with the options and results.
+    With "chasers", the flow field benchmark is run as well, with that many actors,
+    and with "paths", the path finding one, with that many queries of each kind.
+    "walls" is the ratio of wall tiles in the map, and "unshared_walls" gives
+    every wall a GameObject of its own, as tiles that keep state have.
+    The game window has size "window", in pixels, showing blocks of "blocksize"
+    pixels - by default, 16 blocks across.
+    """
+    scene_options = scene_options or {}
+    # the window is given to the scene as well, to work out the block size
+    window = tuple(window)
+    view_options = dict(scene_options, display_size=window)
+    if blocksize:
+        view_options["window_width"] = window[0] // blocksize
+    cleanup = directory is None
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="mapengine_bench_")
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        pygame.init()
+        wall_ratio = 0.1 if walls is None else walls
+        generate_scene(directory, size=size, tiles=tiles, density=density, wall_ratio=wall_ratio, seed=seed)
+        Benchwall.shared = not unshared_walls
+        add_scene_path(directory)
+
+        start = time.perf_counter()
+        scene = Scene(SCENE_NAME, **view_options)
+        controller = BenchController(window, scene)
+        load_time = time.perf_counter() - start
+        results = {
+            "load": {
+                "total": 1000 * load_time,
+                "actors": 1000 * controller.actors_load_time,
+                "actor_count": len(controller.all_actors),
+            },
+        }
+        scene.left = scene.target_left = scene.top = scene.target_top = size // 2
+
+        def draw():
+            controller.draw()
+            controller.present()
+
+        # warm up caches before timing the steady state
+        controller.update()
+        controller.present()
+        results["update"] = timed(controller.step, frames)
+        results["draw"] = timed(draw, frames)
+
+        moves = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+        state = {"frame": 0}
+
+        def scroll():
+            # one block each frame, in a different direction every 8 frames
+            direction = moves[(state["frame"] // 8) % len(moves)]
+            scene.left += direction[0]
+            scene.top += direction[1]
+            scene.target_left, scene.target_top = scene.left, scene.top
+            state["frame"] += 1
+            controller.update()
+            controller.present()
+
+        results["scroll"] = timed(scroll, frames)
+        results["vectors"] = vectors(controller, frames)
+        results["blits"] = blits(controller)
+        results["tiles"] = tile_memory(scene)
+        if chasers:
+            results["chase"] = chase(controller, chasers, frames, seed)
+        if paths:
+            results["paths"] = pathfinding(controller, paths, seed)
+        results["render"] = rendering(window, view_options, frames, scene_options.get("render_chunk_size") or 16)
+        controller.quit()
+    finally:
+        if cleanup:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    options = {
+        "size": size, "tiles": tiles, "density": density,
+        "frames": frames, "seed": seed, "scene": scene_options,
+    }
+    if chasers:
+        options["chasers"] = chasers
+    if walls is not None:
+        options["walls"] = walls
+    if unshared_walls:
+        options["unshared_walls"] = True
+    if paths:
+        options["paths"] = paths
+    if window != (800, 600):
+        options["window"] = list(window)
+    if blocksize:
+        options["blocksize"] = blocksize
+    return {
+        "version": BENCH_VERSION,
+        "options": options,
+        "environment": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": numpy.__version__ if numpy else None,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    for key, value in sorted(results.items()):
+        if isinstance(value, dict):
+            for item in flatten(value, prefix + key + "."):
+                yield item
+        else:
+            yield prefix + key, value
+
+
+def compare(old, new):
+    """
+    Lines comparing the results of two benchmark runs
+    """
+    if old["options"] != new["options"]:
+        yield "Warning: runs with different options: {} x {}".format(old["options"], new["options"])
+    old_values = dict(flatten(old["results"]))
+    for key, value in flatten(new["results"]):
+        if key not in old_values:
+            continue
+        before = old_values[key]
+        change = "{:+.1f}%".format(100.0 * (value - before) / before) if before else ""
+        yield "{:<28} {:>10.3f} {:>10.3f} {:>8}".format(key, before, value, change)
+
+
+def print_results(results):
+    for key, value in flatten(results["results"]):
+        print("{:<28} {:>10.3f}".format(key, value))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m mapengine.bench", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=256, help="map width and height, in blocks")
+    parser.add_argument("--tiles", type=int, default=6, help="number of distinct plain tiles")
+    parser.add_argument("--density", type=float, default=2.0, help="actors per 100 blocks")
+    parser.add_argument("--frames", type=int, default=100, help="frames timed for each benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chasers", type=int, default=0, help="also time this many actors chasing a main character with a flow field")
+    parser.add_argument("--paths", type=int, default=0, help="also time and check this many path finding queries")
+    parser.add_argument("--walls", type=float, default=None, help="ratio of wall tiles in the map (default 0.1)")
+    parser.add_argument("--unshared-walls", action="store_true", help="one wall GameObject per cell, as for tiles that keep state")
+    parser.add_argument("--window", default="800x600", help="game window size, in pixels (default 800x600)")
+    parser.add_argument("--blocksize", type=int, default=None, help="block size, in pixels (default: 16 blocks across the window)")
+    parser.add_argument("--render-chunk-size", type=int, default=None, help="Scene render_chunk_size (0 to draw block by block)")
+    parser.add_argument("--compiled-cache", action="store_true", help="use compiled scene bundles (with --directory, loads from the second run on are cached)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Scene chunk_size, for streamed scenes")
+    parser.add_argument("--directory", help="generate the scene in this directory, and keep it (default: a temporary directory)")
+    parser.add_argument("--output", "-o", help="write results as JSON to this file")
+    parser.add_argument("--compare", "-c", help="JSON results of a previous run to compare with")
+    options = parser.parse_args(args)
+
+    scene_options = {}
+    if options.render_chunk_size is not None:
+        scene_options["render_chunk_size"] = options.render_chunk_size
+    if options.chunk_size is not None:
+        scene_options["chunk_size"] = options.chunk_size
+    if options.compiled_cache:
+        scene_options["compiled_cache"] = True
+
+    results = run(
+        size=options.size, tiles=options.tiles, density=options.density,
+        frames=options.frames, seed=options.seed, scene_options=scene_options,
+        directory=options.directory, chasers=options.chasers,
+        paths=options.paths, walls=options.walls, unshared_walls=options.unshared_walls,
+        window=[int(value) for value in options.window.lower().split("x")], blocksize=options.blocksize,
+    )
+    if options.output:
+        with open(options.output, "w") as file_:
+            json.dump(results, file_, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as file_:
+            old = json.load(file_)
+        print("{:<28} {:>10} {:>10} {:>8}".format("(ms)", "before", "after", "change"))
+        for line in compare(old, results):
+            print(line)
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+# coding: utf-8
+"""
+Compiled scene bundles.
+
+A bundle stores everything Scene.load derives from the scene source files -
+the decoded tile-index grid, the actor plane and spawn list, the palette
+and the tile images already scaled to the scene blocksize - in a directory
+named "<scene_name>.<blocksize>.mapc". Grids and images are stored raw,
+and are memory-mapped back when the bundle is loaded.
+
+A bundle is only used while the hashes of all source files it was
+compiled from (map and actor PNGs, GIMP palette and tile images) match.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy
+import pygame
+
+from .global_states import SCENE_PATH
+from .palette import Palette
+from .resources import resources
+from .utils import resource_path
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_VERSION = 1
+CACHE_DIR_NAME = "__mapcache__"
+
+
+def file_hash(path):
+    if path is None:
+        return None
+    digest = hashlib.sha1()
+    with resources.open(path) as file_:
+        for block in iter(lambda: file_.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_directory(scene):
+    """
+    Directory for compiled scene data: the scene "compiled_cache" can be
+    the path of a cache directory - otherwise a "__mapcache__" directory
+    next to the map file is used.
+    """
+    if isinstance(scene.compiled_cache, str):
+        return scene.compiled_cache
+    map_path = resource_path(scene.image_filename(), SCENE_PATH)
+    if map_path is None or resources.in_archive(map_path):
+        # scenes in zip archives are only cached in an explicit compiled_cache directory
+        return None
+    return os.path.join(os.path.dirname(map_path), CACHE_DIR_NAME)
+
+
+def hash_sources(filenames):
+    """
+    Maps each role in filenames to (filename, (path, hash)) for the file
+    found in the scene path.
+    """
+    sources = {}
+    for role, filename in filenames.items():
+        path = resource_path(filename, SCENE_PATH)
+        sources[role] = (filename, (path, file_hash(path)))
+    return sources
+
+
+def sources_unchanged(sources):
+    for filename, (path, digest) in sources.values():
+        current_path = resource_path(filename, SCENE_PATH)
+        if current_path != path or file_hash(current_path) != digest:
+            return False
+    return True
+
+
+def replace_file(path, writer):
+    # Write to a temporary file and rename it over the target, so
+    # that arrays still memory-mapped from an older bundle are never truncated.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file_:
+        writer(file_)
+    os.replace(tmp_path, path)
+
+
+def write_json(path, data):
+    replace_file(path, lambda file_: file_.write(json.dumps(data).encode("utf-8")))
+
+
+def read_json(path):
+    try:
+        with open(path) as file_:
+            return json.load(file_)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+class SceneBundle(object):
+    extension = ".mapc"
+
+    def __init__(self, path, blocksize):
+        self.path = path
+        self.blocksize = blocksize
+        self.manifest = None
+
+    @classmethod
+    def for_scene(cls, scene, blocksize=None):
+        """
+        Bundle of scene for the given blocksize - by default, the scene blocksize
+        """
+        if blocksize is None:
+            blocksize = scene.blocksize
+        directory = cache_directory(scene)
+        if directory is None:
+            return None
+        name = "{}.{}{}".format(scene.scene_name, blocksize, cls.extension)
+        return cls(os.path.join(directory, name), blocksize)
+
+    @staticmethod
+    def source_files(scene, tile_names):
+        sources = {
+            "map": scene.image_filename(),
+            "actors": scene.image_filename(sufix=scene.actor_plane_sufix),
+            "palette": scene.mapdescription,
+        }
+        for name in tile_names:
+            sources["tile:" + name] = scene.image_filename(name)
+        return sources
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def read_manifest(self):
+        self.manifest = read_json(self._file("manifest.json"))
+        return self.manifest
+
+    def is_valid(self, scene):
+        manifest = self.read_manifest()
+        if not manifest or manifest.get("version") != BUNDLE_VERSION:
+            return False
+        if manifest["blocksize"] != self.blocksize:
+            return False
+        if not sources_unchanged(manifest["sources"]):
+            logger.info("Compiled scene at '{}' is outdated".format(self.path))
+            return False
+        return True
+
+    def save(self, scene, tile_names, tile_images):
+        """
+        Compiles the already loaded scene into this bundle, along with the
+        given tile images, already scaled to the scene blocksize.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        sources = hash_sources(self.source_files(scene, tile_names))
+
+        spawns = [(x, y, scene.actor_grid[x, y]) for (x, y), cls in scene.iter_actor_spawns()]
+        arrays = {
+            "tiles": scene.tile_grid,
+            "actors": scene.actor_grid,
+            "colors": scene.pack_plane(scene.image),
+            "spawns": numpy.array(spawns, dtype=numpy.int32).reshape(-1, 3),
+        }
+        for name, array in arrays.items():
+            replace_file(self._file(name + ".npy"), lambda file_: numpy.save(file_, array))
+
+        images = {}
+        for index, (name, image) in enumerate(sorted(tile_images.items())):
+            filename = "tile{}.rgba".format(index)
+            data = pygame.image.tobytes(image, "RGBA")
+            replace_file(self._file(filename), lambda file_: file_.write(data))
+            images[name] = (filename, image.get_size())
+
+        manifest = {
+            "version": BUNDLE_VERSION,
+            "blocksize": scene.blocksize,
+            "size": [scene.width, scene.height],
+            "palette": scene.palette.entries,
+            "sources": sources,
+            "images": images,
+        }
+        write_json(self._file("manifest.json"), manifest)
+        self.manifest = manifest
+        logger.info("Compiled scene '{}' to '{}'".format(scene.scene_name, self.path))
+
+    def load_into(self, scene):
+        """
+        Sets up the scene data from this bundle - call only after "is_valid".
+        Nothing is decoded: grids and tile images point into memory-mapped files.
+
+        Returns a dictionary with the pre-scaled tile images by name.
+        """
+        manifest = self.manifest
+        scene.image = scene.actor_plane = None
+        scene.palette = Palette(manifest["sources"]["palette"][1][0], entries=manifest["palette"])
+        scene.width, scene.height = manifest["size"]
+        # copy-on-write: the grids can be changed in memory without touching the bundle
+        scene.tile_grid = numpy.load(self._file("tiles.npy"), mmap_mode="c")
+        scene.actor_grid = numpy.load(self._file("actors.npy"), mmap_mode="c")
+        scene.color_grid = numpy.load(self._file("colors.npy"), mmap_mode="r")
+        scene.actor_spawns = [
+            ((x, y), index) for x, y, index in numpy.load(self._file("spawns.npy")).tolist()
+        ]
+        # Surfaces created from buffers do not keep the buffer alive by themselves
+        scene.bundle_buffers = []
+        images = {}
+        for name, (filename, size) in manifest["images"].items():
+            buffer_ = numpy.memmap(self._file(filename), dtype=numpy.uint8, mode="c")
+            scene.bundle_buffers.append(buffer_)
+            images[name] = pygame.image.frombuffer(buffer_, tuple(size), "RGBA")
+        return images
@@ -0,0 +1,266 @@
+# coding: utf-8
+"""
+Chunked scene storage, for maps too big to be kept in memory.
+
+The decoded map is split in square regions of "chunk_size" blocks, each
+one stored in its own file. A ChunkLoader keeps only the chunks around the
+displayed area in memory: the rest of the map is loaded as the view
+approaches it and dropped when it gets far away.
+Neither class depends on a display being set.
+"""
+
+from collections import OrderedDict
+import logging
+import os
+
+import numpy
+
+from .bundle import cache_directory, hash_sources, sources_unchanged, replace_file, read_json, write_json
+from .palette import Palette
+
+logger = logging.getLogger(__name__)
+
+CHUNKS_VERSION = 1
+
+
+class Chunk(object):
+    __slots__ = ["key", "left", "top", "tiles", "actors", "colors"]
+
+    def __init__(self, key, left, top, tiles, actors, colors):
+        self.key = key
+        self.left = left
+        self.top = top
+        self.tiles = tiles
+        self.actors = actors
+        self.colors = colors
+
+    @property
+    def spawns(self):
+        """
+        (position, palette index) for each actor in the chunk, columns first
+        """
+        for x, y in numpy.argwhere(self.actors >= 0).tolist():
+            yield (self.left + x, self.top + y), int(self.actors[x, y])
+
+
+class ChunkStore(object):
+    """
+    On disk storage of a scene split in chunks, in a "<scene_name>.<chunk_size>.chunks"
+    directory in the scene cache directory (see mapengine.bundle).
+    """
+    extension = ".chunks"
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest = None
+
+    @classmethod
+    def for_scene(cls, scene):
+        directory = cache_directory(scene)
+        if directory is None:
+            return None
+        name = "{}.{}{}".format(scene.scene_name, scene.chunk_size, cls.extension)
+        return cls(os.path.join(directory, name))
+
+    @staticmethod
+    def source_files(scene):
+        return {
+            "map": scene.image_filename(),
+            "actors": scene.image_filename(sufix=scene.actor_plane_sufix),
+            "palette": scene.mapdescription,
+        }
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _chunk_file(self, key):
+        return self._file("chunk_{}_{}.npz".format(*key))
+
+    def is_valid(self, scene):
+        manifest = read_json(self._file("manifest.json"))
+        if not manifest or manifest.get("version") != CHUNKS_VERSION:
+            return False
+        if manifest["chunk_size"] != scene.chunk_size:
+            return False
+        if not sources_unchanged(manifest["sources"]):
+            logger.info("Chunked scene at '{}' is outdated".format(self.path))
+            return False
+        return True
+
+    def build(self, scene):
+        """
+        Splits a scene loaded from its source files in chunks.
+        This is the only time the whole map has to fit in memory.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        size = scene.chunk_size
+        colors = scene.pack_plane(scene.image)
+        actors = numpy.full((scene.width, scene.height), -1, dtype=numpy.int32)
+        plane = scene.actor_grid[:scene.width, :scene.height]
+        actors[:plane.shape[0], :plane.shape[1]] = plane
+        for left in range(0, scene.width, size):
+            for top in range(0, scene.height, size):
+                area = (slice(left, left + size), slice(top, top + size))
+                key = (left // size, top // size)
+                replace_file(self._chunk_file(key), lambda file_: numpy.savez(
+                    file_, tiles=scene.tile_grid[area], actors=actors[area], colors=colors[area]
+                ))
+        spawns = numpy.argwhere(actors >= 0).astype(numpy.int32)
+        spawns = numpy.column_stack([spawns, actors[spawns[:, 0], spawns[:, 1]]])
+        replace_file(self._file("spawns.npy"), lambda file_: numpy.save(file_, spawns))
+        write_json(self._file("manifest.json"), {
+            "version": CHUNKS_VERSION,
+            "chunk_size": size,
+            "size": [scene.width, scene.height],
+            "palette": scene.palette.entries,
+            "sources": hash_sources(self.source_files(scene)),
+        })
+        logger.info("Split scene '{}' into chunks at '{}'".format(scene.scene_name, self.path))
+
+    def open(self):
+        self.manifest = manifest = read_json(self._file("manifest.json"))
+        self.chunk_size = manifest["chunk_size"]
+        self.size = tuple(manifest["size"])
+        self.palette = Palette(manifest["sources"]["palette"][1][0], entries=manifest["palette"])
+        # (x, y, palette index) of every actor in the map
+        self.spawns = numpy.load(self._file("spawns.npy"), mmap_mode="r")
+        return self
+
+    def load(self, key):
+        size = self.chunk_size
+        with numpy.load(self._chunk_file(key)) as data:
+            return Chunk(key, key[0] * size, key[1] * size, data["tiles"], data["actors"], data["colors"])
+
+
+class ChunkLoader(object):
+    """
+    Keeps the chunks of a ChunkStore around a view in memory.
+
+    Chunks within "margin" chunks of the view are "active" - their actors
+    are alive. Active chunks are only deactivated once they are more than
+    margin + 1 chunks away, so that walking along a chunk border does not
+    load and unload the same chunks over and over.
+    Inactive chunks may still be loaded for map lookups, and up to
+    "cached_chunks" of those are kept around.
+
+    The actors of inactive chunks are kept "suspended" for up to
+    "suspended_chunks" chunks: past that, those of the chunks left the
+    longest ago are dropped, and the chunks spawn the actors on the map
+    again when activated.
+    """
+
+    def __init__(self, store, margin=1, cached_chunks=16, suspended_chunks=64):
+        self.store = store
+        self.chunk_size = store.chunk_size
+        self.width, self.height = store.size
+        self.margin = margin
+        self.cached_chunks = cached_chunks
+        self.suspended_chunks = suspended_chunks
+        self.chunks = OrderedDict()
+        self.active = set()
+        # suspended actors, by chunk
+        self.suspended = OrderedDict()
+        # chunks whose actors on the map were spawned
+        self.spawned = set()
+        # Called with (left, top, width, height) of each chunk dropped from memory
+        self.on_evict = None
+
+    def key(self, position):
+        return (position[0] // self.chunk_size, position[1] // self.chunk_size)
+
+    def region(self, key):
+        size = self.chunk_size
+        return key[0] * size, key[1] * size, size, size
+
+    def chunk(self, key):
+        try:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+        except KeyError:
+            pass
+        chunk = self.chunks[key] = self.store.load(key)
+        self._evict()
+        return chunk
+
+    def _evict(self):
+        inactive = [key for key in self.chunks if key not in self.active]
+        for key in inactive[:max(0, len(inactive) - self.cached_chunks)]:
+            del self.chunks[key]
+            if self.on_evict:
+                self.on_evict(*self.region(key))
+
+    def _cell(self, position):
+        chunk = self.chunk(self.key(position))
+        return chunk, position[0] - chunk.left, position[1] - chunk.top
+
+    def tile_index(self, position):
+        chunk, x, y = self._cell(position)
+        return int(chunk.tiles[x, y])
+
+    def actor_index(self, position):
+        chunk, x, y = self._cell(position)
+        return int(chunk.actors[x, y])
+
+    def color_at(self, position):
+        chunk, x, y = self._cell(position)
+        return int(chunk.colors[x, y])
+
+    def keys_around(self, left, top, width, height, margin):
+        size = self.chunk_size
+        last_x = (self.width - 1) // size
+        last_y = (self.height - 1) // size
+        x0 = max(0, left // size - margin)
+        x1 = min(last_x, (left + width - 1) // size + margin)
+        y0 = max(0, top // size - margin)
+        y1 = min(last_y, (top + height - 1) // size + margin)
+        return set((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+    def update(self, left, top, width, height):
+        """
+        Updates the active chunks for a view with the given position and size, in blocks.
+        Returns the lists of newly activated and deactivated chunk keys
+        """
+        wanted = self.keys_around(left, top, width, height, self.margin)
+        keep = self.keys_around(left, top, width, height, self.margin + 1)
+        activated = sorted(wanted - self.active)
+        deactivated = sorted(self.active - keep)
+        self.active.difference_update(deactivated)
+        self.active.update(activated)
+        for key in activated:
+            self.chunk(key)
+        self._evict()
+        return activated, deactivated
+
+    def suspend(self, key, actors):
+        """
+        Keeps actors suspended in chunk key. Returns the actors dropped
+        to keep those of at most "suspended_chunks" chunks.
+        """
+        if actors:
+            self.suspended.setdefault(key, []).extend(actors)
+            self.suspended.move_to_end(key)
+        dropped = []
+        while len(self.suspended) > self.suspended_chunks:
+            old_key, old_actors = self.suspended.popitem(last=False)
+            self.spawned.discard(old_key)
+            dropped.extend(old_actors)
+        return dropped
+
+    def resume(self, key):
+        """
+        Returns the actors suspended in chunk key, and whether the actors
+        of the chunk on the map are still to be spawned.
+        """
+        to_spawn = key not in self.spawned
+        self.spawned.add(key)
+        return self.suspended.pop(key, []), to_spawn
+
+    def spawns_of(self, indexes):
+        """
+        (position, palette index) for every actor in the map with one of
+        the given palette indexes, regardless of the loaded chunks.
+        """
+        spawns = self.store.spawns
+        for x, y, index in spawns[numpy.isin(spawns[:, 2], list(indexes))].tolist():
+            yield (x, y), index
@@ -7,8 +7,6 @@ from .fonts import FontLoader
 import pygame
 from pygame.locals import *
 
-FRAME_DELAY= 30
-
 class Cut(object):
     title_font = "sans.ttf", 64
     option_font = "sans.ttf", 32
@@ -28,58 +26,95 @@ class Cut(object):
         # are displayed prefixed with a single numeric choice.
 
         self.background = kw.get("background", (0, 0, 0))
+        # Cuts are static: they are drawn once and then just wait for input.
+        # Animated cuts can set a "timeout", in milliseconds, after
+        # which they are drawn again even if nothing happened.
+        self.timeout = kw.get("timeout", None)
         self.kwargs = kw
 
     def __call__(self, controller):
-        self.current_title_font = FontLoader(*self.title_font)
-        self.current_options_font = FontLoader(*self.option_font)
-        self.rendered_title = None
-        self.rendered_options = []
+        # Fonts are kept from previous entries in the cut - and the texts
+        # rendered with them come from the shared text cache (see fonts.text_cache)
+        if getattr(self, "current_title_font", None) is None:
+            self.current_title_font = FontLoader(*self.title_font)
+            self.current_options_font = FontLoader(*self.option_font)
+        self.rendered = None
+        self.rendered_key = None
         self.controller = controller
+        # Keys pressed while playing should not choose an option
+        pygame.event.clear(KEYDOWN)
         return self
 
-    def update(self):
-        screen = self.controller.screen
+    def _render_key(self):
+        return (self.controller.screen.get_size(), self.title, tuple(option[0] for option in self.options))
+
+    def draw(self, surface):
+        """
+        Draws the whole cut on surface - override this for custom cuts
+        """
         screenparts = len(self.options) + 2
-        y_step = screen.get_height() // screenparts
+        y_step = surface.get_height() // screenparts
 
         # TODO: Use font animation library (factor out from gedigi-pygame)
-        if not self.rendered_title:
-            self.rendered_title = self.current_title_font.render(self.title)
-            for i, option in enumerate(self.options, 1):
-                self.rendered_options.append(self.current_options_font.render(u"{} - {}".format(i, option[0])))
-
-        # WIP: for now, cuts are static text - so no need to re-render at each frame
-        # (but for now, we need to re-render at least once - so it is out of the above
-        # "if" block)
+        rendered_title = self.current_title_font.render(self.title)
+        rendered_options = [
+            self.current_options_font.render(u"{} - {}".format(i, option[0]))
+            for i, option in enumerate(self.options, 1)
+        ]
+
         if isinstance(self.background, pygame.Surface):
-            screen.blit(self.background, (0,0))
+            surface.blit(self.background, (0,0))
         else:
-            screen.fill(self.background)
-        offset_x = (screen.get_width() - self.rendered_title.get_width()) // 2
-        offset_y = y_step - self.rendered_title.get_height() // 2
-        screen.blit(self.rendered_title, (offset_x, offset_y))
-        for r_option, offset_y in zip(self.rendered_options, range(y_step * 2, screen.get_height(), y_step)):
-            offset_x = (screen.get_width() - r_option.get_width()) // 2
+            surface.fill(self.background)
+        offset_x = (surface.get_width() - rendered_title.get_width()) // 2
+        offset_y = y_step - rendered_title.get_height() // 2
+        surface.blit(rendered_title, (offset_x, offset_y))
+        for r_option, offset_y in zip(rendered_options, range(y_step * 2, surface.get_height(), y_step)):
+            offset_x = (surface.get_width() - r_option.get_width()) // 2
             offset_y = offset_y - r_option.get_height() // 2
-            screen.blit(r_option, (offset_x, offset_y))
+            surface.blit(r_option, (offset_x, offset_y))
+
+    def render(self):
+        screen = self.controller.screen
+        self.rendered = pygame.Surface(screen.get_size())
+        self.draw(self.rendered)
+        self.rendered_key = self._render_key()
+        self.show()
+
+    def show(self):
+        self.controller.screen.blit(self.rendered, (0, 0))
         pygame.display.flip()
 
+    def wait(self):
+        if self.timeout is None:
+            return pygame.event.wait()
+        return pygame.event.wait(self.timeout)
+
+    def update(self):
+        if self.rendered is None or self.rendered_key != self._render_key():
+            # Just show the cut when it is entered or changes, and wait on the next call
+            return self.render()
+
+        # Blocks until something happens - a static cut takes no CPU time while idle
+        event = self.wait()
+        if event.type == NOEVENT:
+            # timeout of an animated cut
+            self.rendered = None
+        elif event.type in (VIDEOEXPOSE, WINDOWEXPOSED, WINDOWRESTORED, WINDOWSHOWN):
+            self.show()
+        elif event.type == KEYDOWN:
+            self.on_key(event.key)
 
-        pygame.event.pump()
-        keys = pygame.key.get_pressed()
-        if not self.options and (keys[K_SPACE] or keys[K_RETURN] or keys[K_ESCAPE]):
+    def on_key(self, key):
+        if not self.options and key in (K_SPACE, K_RETURN, K_ESCAPE):
             if self.exit:
                 self.exit(self.controller)
             else:
                 raise CutExit
         for i, option in enumerate(self.options, 1):
             # <esc> also triggers the first option
-            if keys[ord(str(i))] or keys[K_ESCAPE]:
+            if key == ord(str(i)) or key == K_ESCAPE:
+                # (the callable could change our options - which
+                # are then drawn again on the next update)
                 option[1](self.controller)
-                # a pause to allow for menu navigation - 
-                # (the callable could change our options)
-                pygame.time.delay(350)
                 break
-
-        pygame.time.delay(FRAME_DELAY)
\ No newline at end of file
@@ -0,0 +1,275 @@
+# coding: utf-8
+"""
+Flow fields: the distance, in moves, from every cell of a scene to the
+nearest of a set of target cells - by default, the position of the main
+character. Any number of actors can then find their next move towards
+the target by looking at the cell they are in.
+
+When a single target moves to a neighbouring cell, the field is repaired
+instead of computed again: see repair_distances.
+
+Requires numpy.
+"""
+
+import numpy
+
+# direction codes in FlowField.directions
+STEPS = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))
+NO_STEP = 0
+
+
+def target_cells(target):
+    """
+    Frozen set of the cells of a position or list of positions - None stays None
+    """
+    if target is None:
+        return None
+    if len(target) == 2 and not hasattr(target[0], "__len__"):
+        return frozenset([(int(target[0]), int(target[1]))])
+    return frozenset((int(x), int(y)) for x, y in target)
+
+
+def tile_hardness(scene):
+    """
+    Hardness of the tile in each cell of scene, as an array indexed by [x, y]
+    """
+    return scene.hardness_grid.block(0, 0, scene.width, scene.height)
+
+
+def padded_distances(passable, targets):
+    """
+    Breadth first search from all targets at once, over the cells where
+    passable (a boolean array indexed by [x, y]) is True - targets themselves
+    need not be passable. Each step of the search handles the whole
+    frontier with array operations.
+
+    Returns an int32 array with the distance of each cell to the nearest
+    target - -1 for the cells from which no target can be reached - with
+    a border of one cell, set to -1, around the map.
+    """
+    width, height = passable.shape
+    # the border of closed cells spares checking the map limits
+    stride = height + 2
+    unvisited = numpy.zeros((width + 2, height + 2), dtype=bool)
+    unvisited[1:-1, 1:-1] = passable
+    unvisited = unvisited.ravel()
+    distances = numpy.full(unvisited.shape, -1, dtype=numpy.int32)
+    frontier = numpy.array(
+        [(x + 1) * stride + y + 1 for x, y in targets if 0 <= x < width and 0 <= y < height],
+        dtype=numpy.intp
+    )
+    distances[frontier] = 0
+    unvisited[frontier] = False
+    offsets = numpy.array([stride, -stride, 1, -1], dtype=numpy.intp)
+    # cells reached from more than one frontier cell are kept once: the last
+    # write of each cell's index in "order" wins, with no sorting
+    order = numpy.zeros(unvisited.shape, dtype=numpy.intp)
+    distance = 0
+    while frontier.size:
+        distance += 1
+        reached = (frontier[:, numpy.newaxis] + offsets).ravel()
+        reached = reached[unvisited[reached]]
+        indexes = numpy.arange(reached.size)
+        order[reached] = indexes
+        frontier = reached[order[reached] == indexes]
+        unvisited[frontier] = False
+        distances[frontier] = distance
+    return distances.reshape(width + 2, height + 2)
+
+
+def distance_field(passable, targets):
+    """
+    Distance of each cell to the nearest of targets, as padded_distances,
+    with no border
+    """
+    return padded_distances(passable, targets)[1:-1, 1:-1]
+
+
+def repair_distances(padded, target):
+    """
+    Updates, in place, the distances given by padded_distances for a single
+    target, for that target moved to the neighbouring cell "target" - which
+    must be at distance 1, and the old target passable.
+
+    The 4-connected grid is bipartite, so the distance of every reachable cell
+    changes by exactly one: it goes down for the cells with a way to the new
+    target through ever smaller old distances, and up for all others. Only
+    the cells getting closer are searched.
+
+    Returns a boolean array, of the shape of padded, marking those cells.
+    """
+    stride = padded.shape[1]
+    distances = padded.ravel()
+    closer = numpy.zeros(distances.shape, dtype=bool)
+    order = numpy.zeros(distances.shape, dtype=numpy.intp)
+    offsets = numpy.array([stride, -stride, 1, -1], dtype=numpy.intp)
+    frontier = numpy.array([(target[0] + 1) * stride + target[1] + 1], dtype=numpy.intp)
+    closer[frontier] = True
+    distance = 1
+    while frontier.size:
+        distance += 1
+        reached = (frontier[:, numpy.newaxis] + offsets).ravel()
+        reached = reached[distances[reached] == distance]
+        indexes = numpy.arange(reached.size)
+        order[reached] = indexes
+        frontier = reached[order[reached] == indexes]
+        closer[frontier] = True
+    reachable = distances >= 0
+    distances[reachable] += 1
+    distances[closer] -= 2
+    return closer.reshape(padded.shape)
+
+
+def direction_field(distances):
+    """
+    For each cell, the code (an index in STEPS) of the move to the neighbour
+    closest to a target - NO_STEP for targets and unreachable cells.
+    """
+    width, height = distances.shape
+    far = numpy.iinfo(numpy.int32).max
+    padded = numpy.full((width + 2, height + 2), far, dtype=numpy.int32)
+    padded[1:-1, 1:-1] = numpy.where(distances < 0, far, distances)
+    neighbours = numpy.stack([
+        padded[1:-1, 1:-1],
+        padded[2:, 1:-1],
+        padded[:-2, 1:-1],
+        padded[1:-1, 2:],
+        padded[1:-1, :-2],
+    ])
+    # staying put comes first, so it wins ties: targets do not move
+    return numpy.argmin(neighbours, axis=0).astype(numpy.int8)
+
+
+def repair_directions(directions, padded, closer):
+    """
+    Updates, in place, the directions of the cells whose step may have changed
+    after repair_distances. Where a cell and its reachable neighbours all got
+    closer, or all got farther, their order is the same: only cells with
+    neighbours that changed the other way are computed again.
+    """
+    reachable = padded >= 0
+    inner = closer[1:-1, 1:-1]
+    any_closer = numpy.zeros(inner.shape, dtype=bool)
+    any_farther = numpy.zeros(inner.shape, dtype=bool)
+    for neighbour in ((slice(2, None), slice(1, -1)), (slice(None, -2), slice(1, -1)),
+                      (slice(1, -1), slice(2, None)), (slice(1, -1), slice(None, -2))):
+        any_closer |= closer[neighbour]
+        any_farther |= reachable[neighbour] & ~closer[neighbour]
+    # unreachable cells - walls included - step to their closest reachable neighbour
+    changed = numpy.where(
+        reachable[1:-1, 1:-1],
+        numpy.where(inner, any_farther, any_closer),
+        any_closer & any_farther,
+    )
+    xs, ys = numpy.nonzero(changed)
+    xs += 1
+    ys += 1
+    far = numpy.iinfo(numpy.int32).max
+    # same order as STEPS
+    neighbours = numpy.stack([
+        padded[xs, ys], padded[xs + 1, ys], padded[xs - 1, ys], padded[xs, ys + 1], padded[xs, ys - 1],
+    ])
+    neighbours[neighbours < 0] = far
+    directions[xs - 1, ys - 1] = numpy.argmin(neighbours, axis=0)
+
+
+class FlowField(object):
+    """
+    Distances to target for actors of the given strength: cells whose tile hardness
+    is over strength are not walked through. Target may be a position, a list
+    of positions or an actor - or None, to follow the main character of the controller.
+
+    The field is only computed again when the target cells change - checked
+    once per controller tick - or when tiles change. A single target moving
+    to a neighbouring cell has the field repaired instead.
+    """
+
+    def __init__(self, controller, strength=4, target=None):
+        self.controller = controller
+        self.strength = strength
+        # an actor to follow
+        self.leader = target if hasattr(target, "pos") else None
+        self.target = None if self.leader is not None else target_cells(target)
+        self.target_cells = None
+        self.hardness = None
+        # distances with a border (see padded_distances), and a view without it
+        self.padded = None
+        self.distances = None
+        self.directions = None
+        self.checked_tick = None
+        self.computed = 0
+        self.repaired = 0
+
+    def current_targets(self):
+        if self.target is not None:
+            return self.target
+        if self.leader is not None:
+            return frozenset([(int(self.leader.pos[0]), int(self.leader.pos[1]))])
+        main_character = getattr(self.controller, "main_character", None)
+        sprites = main_character.sprites() if main_character else []
+        return frozenset((int(sprite.pos[0]), int(sprite.pos[1])) for sprite in sprites)
+
+    def refresh(self):
+        tick = self.controller.tick
+        if tick == self.checked_tick and self.distances is not None:
+            return
+        self.checked_tick = tick
+        targets = self.current_targets()
+        if targets == self.target_cells and self.distances is not None:
+            return
+        if self.can_repair(targets):
+            closer = repair_distances(self.padded, next(iter(targets)))
+            repair_directions(self.directions, self.padded, closer)
+            self.repaired += 1
+        else:
+            if self.hardness is None:
+                self.hardness = tile_hardness(self.controller.scene)
+            self.padded = padded_distances(self.hardness <= self.strength, targets)
+            self.distances = self.padded[1:-1, 1:-1]
+            self.directions = direction_field(self.distances)
+            self.computed += 1
+        self.target_cells = targets
+
+    def can_repair(self, targets):
+        """
+        Whether the field can be repaired for targets: a single target, which moved
+        from a passable cell to a neighbouring one, with no tile changed since.
+        """
+        if self.distances is None or len(targets) != 1 or len(self.target_cells or ()) != 1:
+            return False
+        (old_x, old_y), = self.target_cells
+        (x, y), = targets
+        if not self._inside((x, y)) or self.hardness[old_x, old_y] > self.strength:
+            return False
+        return self.distances[x, y] == 1
+
+    def tile_changed(self, position):
+        if self.hardness is not None and self._inside(position):
+            # (already done if the array is a view of the scene hardness grid)
+            grid = self.controller.scene.hardness_grid
+            self.hardness[position[0], position[1]] = grid.class_hardness(position[0], position[1])
+            self.distances = None
+
+    def _inside(self, position):
+        return 0 <= position[0] < self.controller.scene.width and 0 <= position[1] < self.controller.scene.height
+
+    def distance(self, position):
+        """
+        Moves from position to the nearest target - or None if it can't be reached
+        """
+        self.refresh()
+        if not self._inside(position):
+            return None
+        distance = int(self.distances[position[0], position[1]])
+        return distance if distance >= 0 else None
+
+    def direction(self, position):
+        """
+        Direction of the next move from position towards the target -
+        or None at a target, or where no target can be reached.
+        """
+        self.refresh()
+        if not self._inside(position):
+            return None
+        code = self.directions[position[0], position[1]]
+        return STEPS[code] if code else None
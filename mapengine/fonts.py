@@ -1,5 +1,6 @@
 #coding: utf-8
 
+from collections import OrderedDict
 import os
 
 from .utils import resource_load
@@ -7,12 +8,65 @@ from .global_states import SCENE_PATH
 
 import pygame
 
+
+class TextCache(object):
+    """
+    Least recently used cache of rendered text surfaces, shared by
+    every FontLoader, Blob and Cut in the process and limited by size in bytes.
+
+    Cached surfaces are shared by everyone rendering the same text:
+    they must not be drawn upon.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def surface_bytes(surface):
+        return surface.get_pitch() * surface.get_height()
+
+    def get(self, key, render):
+        """
+        Returns the surface cached for key - calling render() to create it if needed
+        """
+        try:
+            self.entries.move_to_end(key)
+            surface = self.entries[key]
+            self.hits += 1
+            return surface
+        except KeyError:
+            pass
+        self.misses += 1
+        surface = self.entries[key] = render()
+        self.bytes += self.surface_bytes(surface)
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= self.surface_bytes(old)
+        return surface
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.bytes}
+
+
+text_cache = TextCache()
+
+
 class FontLoader(object):
     font_cache = {}
 
     font_prefix = "fonts/"
     def __init__(self, font_file_name="sans.ttf", size=16, bold=True, **kw):
         self.size = size
+        self.font_file_name = font_file_name
+        self.bold = bold
         paths = [os.path.join(path.rstrip("/").rsplit("/",1)[0], self.font_prefix) for path in SCENE_PATH]
         self.font = resource_load(font_file_name, paths=paths, cache=self.font_cache, loader=self.loader,  cache_extra = str(self.size))
         self.font.set_bold(bold)
@@ -23,5 +77,28 @@ class FontLoader(object):
     def loader(self, path):
         return pygame.font.Font(path, self.size)
 
+    @staticmethod
+    def color_key(color):
+        return None if color is None else tuple(color)
+
+    def text_key(self, *extra):
+        """
+        Key for text_cache of something rendered with this font and color
+        """
+        return (self.font_file_name, self.size, self.bold, self.color_key(self.color), self.antialias) + extra
+
+    def render_line(self, text, background=None):
+        """
+        Renders a single line of text, going through the shared text cache.
+        The text has a transparent background if "background" is None.
+        """
+        def render():
+            # Fonts are shared by every loader with the same file and size
+            self.font.set_bold(self.bold)
+            if background is None:
+                return self.font.render(text, self.antialias, self.color)
+            return self.font.render(text, self.antialias, self.color, background)
+        return text_cache.get(self.text_key(None, self.color_key(background), text), render)
+
     def render(self, text):
-        return self.font.render(text, self.antialias, self.color, self.background)
\ No newline at end of file
+        return self.render_line(text, self.background)
\ No newline at end of file
@@ -0,0 +1,194 @@
+# coding: utf-8
+"""
+Grid of the tile hardness of a scene.
+
+Moving actors check the hardness of the cell they step into, and falling
+actors the one below them, every frame. Getting the tile object of a cell
+for that takes a few dictionary lookups and palette conversions - and may
+create a GameObject for the cell. The hardness grid keeps the hardness of
+the tile class of every cell in a compact array instead, built when the
+scene is loaded and updated when tiles change, read with plain indexing.
+
+The tiles still read from their objects are those of classes that are not
+"shared" - each cell has an instance of its own, which may change its
+hardness - and of classes with an "on_touch" method, as touching them
+needs the object anyway.
+
+The grid also marks the cells with actors in them, as the controller's
+spatial index tells it, so that batches of positions can be checked
+against actors as well with array operations.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .registry import GameObjectClasses
+
+
+def _tile_class(palette, index):
+    return GameObjectClasses.get(palette.name_at(index).lower())
+
+
+def hardness_table(palette):
+    """
+    Tile hardness by palette index - shifted by one, so that colors
+    not in the palette (index -1) have hardness 0
+    """
+    table = [0]
+    for index in range(len(palette.packed)):
+        table.append(getattr(_tile_class(palette, index), "hardness", 0))
+    if numpy is None:
+        return table
+    table = numpy.array(table)
+    if table.dtype.kind == "i" and -128 <= table.min() and table.max() <= 127:
+        table = table.astype(numpy.int8)
+    return table
+
+
+def object_table(palette):
+    """
+    Whether the tiles of each palette index - shifted by one, as in
+    hardness_table - are read from their objects
+    """
+    table = [False]
+    for index in range(len(palette.packed)):
+        cls = _tile_class(palette, index)
+        table.append(cls is not None and cls.needs_tile_object())
+    return numpy.array(table, dtype=bool) if numpy is not None else table
+
+
+class HardnessGrid(object):
+    """
+    Hardness of the tiles of a scene, by cell - 0 outside the map.
+
+    The grid is an array indexed by [x, y] - with no numpy, or for scenes
+    loaded in chunks, there is none: tiles are then read from the chunk
+    tile indexes, or from the tile objects.
+
+    Set the grid as the "observer" of the actors SpatialIndex to have
+    the "occupied" cells marked.
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.width = scene.width
+        self.height = scene.height
+        self.table = hardness_table(scene.palette)
+        self.object_table = object_table(scene.palette)
+        self.grid = None
+        # cells read from their tile objects, if there are any
+        self.objects = None
+        # cells with actors
+        self.occupied = None
+        if scene.tile_grid is not None:
+            indexes = scene.tile_grid[:self.width, :self.height] + 1
+            self.grid = self.table[indexes]
+            if self.object_table.any():
+                self.objects = self.object_table[indexes]
+            self.occupied = numpy.zeros(self.grid.shape, dtype=bool)
+
+    def inside(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_object(self, x, y):
+        """
+        Whether the tile at x, y is read from its object
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        if self.grid is not None:
+            return self.objects is not None and self.objects.item(x, y)
+        loader = self.scene.chunk_loader
+        if loader is not None:
+            return bool(self.object_table[loader.tile_index((x, y)) + 1])
+        return True
+
+    def class_hardness(self, x, y):
+        """
+        Hardness of the class of the tile at x, y
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0
+        if self.grid is not None:
+            return self.grid.item(x, y)
+        loader = self.scene.chunk_loader
+        if loader is not None:
+            return int(self.table[loader.tile_index((x, y)) + 1])
+        return getattr(self.scene[x, y], "hardness", 0)
+
+    def at(self, x, y):
+        """
+        Hardness of the tile at x, y
+        """
+        if self.is_object(x, y):
+            return getattr(self.scene[x, y], "hardness", 0)
+        return self.class_hardness(x, y)
+
+    def values(self, positions, actors=None):
+        """
+        Hardness of the tiles at each of positions - a sequence of (x, y),
+        or an array of shape (n, 2). Returns an array - or a list, with no numpy.
+
+        With "actors", the SpatialIndex observed by the grid, positions with
+        actors get the hardness of the actor there instead, as controller[position].
+        """
+        if numpy is None or self.grid is None:
+            values = [self.at(x, y) for x, y in positions]
+            if actors is not None:
+                for index, position in enumerate(positions):
+                    actor = actors.at(position)
+                    if actor is not None:
+                        values[index] = getattr(actor, "hardness", 0)
+            return numpy.array(values, dtype=int) if numpy is not None else values
+        positions = numpy.asarray(positions, dtype=numpy.intp).reshape(-1, 2)
+        xs, ys = positions[:, 0], positions[:, 1]
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        inside_indexes = numpy.flatnonzero(inside)
+        xs, ys = xs[inside], ys[inside]
+        values = numpy.zeros(len(positions), dtype=int)
+        values[inside] = self.grid[xs, ys]
+        looked_up = []
+        if self.objects is not None:
+            looked_up.append(inside_indexes[self.objects[xs, ys]])
+        if actors is not None:
+            # actors can stand just off the map, where there is no grid
+            looked_up.append(inside_indexes[self.occupied[xs, ys]])
+            looked_up.append(numpy.flatnonzero(~inside))
+        if not looked_up:
+            return values
+        for index in numpy.unique(numpy.concatenate(looked_up)).tolist():
+            x, y = positions[index].tolist()
+            actor = actors.at((x, y)) if actors is not None else None
+            if actor is not None:
+                values[index] = getattr(actor, "hardness", 0)
+            elif self.is_object(x, y):
+                values[index] = getattr(self.scene[x, y], "hardness", 0)
+        return values
+
+    def block(self, x0, y0, x1, y1):
+        """
+        Hardness of the tile classes in x0 <= x < x1 and y0 <= y < y1, indexed
+        by [x - x0, y - y0]: an array - or a list of columns, with no numpy.
+        Tile objects are not looked up.
+        """
+        if self.grid is not None:
+            return self.grid[x0:x1, y0:y1]
+        block = [[self.class_hardness(x, y) for y in range(y0, y1)] for x in range(x0, x1)]
+        return numpy.array(block, dtype=int) if numpy is not None else block
+
+    def tile_changed(self, position):
+        x, y = position[0], position[1]
+        if self.grid is None or not self.inside(x, y):
+            return
+        index = int(self.scene.tile_grid[x, y]) + 1
+        self.grid[x, y] = self.table[index]
+        if self.objects is None and self.object_table[index]:
+            self.objects = numpy.zeros(self.grid.shape, dtype=bool)
+        if self.objects is not None:
+            self.objects[x, y] = self.object_table[index]
+
+    def cell_changed(self, position, occupied):
+        if self.occupied is not None and self.inside(position[0], position[1]):
+            self.occupied[position[0], position[1]] = occupied
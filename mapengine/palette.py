@@ -1,17 +1,56 @@
 # coding: utf-8
+import io
+
 from pygame.color import Color
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def pack(color):
+    """
+    Packs a RGB or RGBA color sequence in a 32 bit integer, as 0xRRGGBBAA
+    """
+    if isinstance(color, Color):
+        return int(color)
+    if len(color) == 3:
+        return (color[0] << 24) | (color[1] << 16) | (color[2] << 8) | 0xff
+    return (color[0] << 24) | (color[1] << 16) | (color[2] << 8) | color[3]
+
+
+def pack_array(pixels):
+    """
+    Packs an array of RGB or RGBA pixels (last axis with the color components)
+    into an array of 32 bit integers, as 0xRRGGBBAA
+    """
+    pixels = pixels.astype(numpy.uint32)
+    alpha = pixels[..., 3] if pixels.shape[-1] == 4 else 0xff
+    return (pixels[..., 0] << 24) | (pixels[..., 1] << 16) | (pixels[..., 2] << 8) | alpha
+
+
 class Palette(object):
     """
     Loads a GIMP Palette file (.gpl) and keeps its
     data in an appropriate form for use of the rest of the application
     """
-    def __init__(self, path):
+    def __init__(self, path, entries=None):
         self.path = path
         self.colors = {}
         self.color_names = {}
         self.by_index = {}
-        self.load()
+        self.names = []
+        # Lookup tables by packed RGBA value (see "pack"):
+        self.packed = []
+        self.packed_names = {}
+        self.packed_indexes = {}
+        self._sorted_keys = None
+        if entries is None:
+            self.load()
+        else:
+            for r, g, b, name in entries:
+                self.add(Color(r, g, b), name)
 
     def __getitem__(self, key):
         if isinstance(key, str):
@@ -20,11 +59,55 @@ class Palette(object):
             if key < 0:
                 key = len(self.by_index) + key
             return self.by_index[key]
-        if isinstance(key, Color):
-            key = tuple(key)
-        if len(key) == 3:
-            key = key + (255,)
-        return self.colors[key]
+        return self.packed_names[pack(key)]
+
+    def name_for(self, color, default=None):
+        """
+        Name for a Color or RGB(A) tuple - or default if it is not in the palette
+        """
+        return self.packed_names.get(pack(color), default)
+
+    def index(self, color, default=-1):
+        """
+        Returns the palette index for a RGBA color tuple, or default
+        if the color is not in the palette
+        """
+        return self.packed_indexes.get(pack(color), default)
+
+    def name_at(self, index):
+        return self.packed_names[self.packed[index]]
+
+    def _lookup_arrays(self):
+        if self._sorted_keys is None:
+            keys = numpy.array(sorted(self.packed_indexes), dtype=numpy.uint32)
+            values = numpy.array([self.packed_indexes[key] for key in keys.tolist()], dtype=numpy.int32)
+            self._sorted_keys = keys, values
+        return self._sorted_keys
+
+    def indices(self, pixels):
+        """
+        Maps a whole array of pixels to palette indexes in a single call.
+        "pixels" is either an array of packed 32 bit colors, or an array whose
+        last axis has RGB or RGBA components. Colors not in the palette
+        are mapped to -1.
+        """
+        pixels = numpy.asarray(pixels)
+        if pixels.dtype != numpy.uint32:
+            pixels = pack_array(pixels)
+        keys, values = self._lookup_arrays()
+        if not len(keys):
+            return numpy.full(pixels.shape, -1, dtype=numpy.int32)
+        positions = numpy.searchsorted(keys, pixels).clip(0, len(keys) - 1)
+        return numpy.where(keys[positions] == pixels, values[positions], -1).astype(numpy.int32)
+
+    def names_for(self, pixels):
+        """
+        As "indices", but returns an object array with the color names
+        (None for colors not in the palette)
+        """
+        indices = self.indices(pixels)
+        names = numpy.array([self.name_at(index) for index in range(len(self.packed))] + [None], dtype=object)
+        return names[indices]
 
     def __len__(self):
         return len(self.colors)
@@ -32,19 +115,39 @@ class Palette(object):
     def __repr__(self):
         return '<Palette {!r}>'.format(self.color_names)
 
+    @property
+    def entries(self):
+        """
+        The palette contents as a list of (r, g, b, name) - in index order
+        """
+        return [tuple(self.by_index[index])[:3] + (name,) for index, name in enumerate(self.names)]
+
+    def add(self, color, name):
+        index = len(self.by_index)
+        packed = pack(color)
+        self.colors[tuple(color)] = name.lower()
+        self.color_names[name.lower()] = color
+        self.by_index[index] = color
+        self.names.append(name.lower())
+        self.packed.append(packed)
+        self.packed_names[packed] = name.lower()
+        self.packed_indexes.setdefault(packed, index)
+        self._sorted_keys = None
+
     def load(self):
-        with open(self.path) as file_:
+        # path may also be an open binary file, as given for palettes in zip archives
+        if hasattr(self.path, "read"):
+            file_ = io.TextIOWrapper(self.path, encoding="utf-8")
+        else:
+            file_ = open(self.path)
+        with file_:
             line = ""
             while not line.strip().startswith('#'):
                 line = next(file_)
-            index = 0
             for line in file_:
                 line = line.strip()
                 if len(line.split()) < 4 or line.startswith('#'):
                     continue
                 r, g, b, name = line.strip().split(None, 4)
                 color = Color(*(int(component) for component in (r, g, b)))
-                self.colors[tuple(color)] = name.lower()
-                self.color_names[name.lower()] = color
-                self.by_index[index] = color
-                index += 1
\ No newline at end of file
+                self.add(color, name)
@@ -0,0 +1,204 @@
+# coding: utf-8
+"""
+Frame profiler: timings of each phase of the game loop - and of the
+updates of each actor class - over the last frames.
+
+Enable it by setting the MAPENGINE_PROFILE environment variable
+(or with Controller.enable_profiler). If the variable value ends in
+".json" or ".csv", the collected statistics are written to that
+file when the controller quits. Set MAPENGINE_PROFILE_OVERLAY to
+show the statistics on screen.
+"""
+
+from collections import deque
+import csv
+import json
+import logging
+import os
+import time
+
+import pygame
+
+logger = logging.getLogger(__name__)
+
+clock = time.perf_counter
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class FrameProfiler(object):
+    """
+    Keeps the durations, in seconds, of the last "capacity" samples of each
+    phase in ring buffers. Phases are just names: the controller records,
+    for each tick, "scene", "events", "actors" and "collisions", and, for
+    each frame drawn, "background", "draw_actors", "messages" and "present".
+    Updates of each actor class are kept as "actor:<class name>".
+    """
+
+    def __init__(self, capacity=600):
+        self.capacity = capacity
+        self.samples = {}
+        self.show_overlay = False
+        # file the statistics are written to when the controller quits:
+        self.output = None
+        self.overlay_refresh = 30
+        self._overlay_image = None
+        self._overlay_age = 0
+
+    def add(self, phase, duration):
+        try:
+            self.samples[phase].append(duration)
+        except KeyError:
+            self.samples[phase] = deque([duration], maxlen=self.capacity)
+
+    def add_actor_times(self, class_times):
+        for name, duration in class_times.items():
+            self.add("actor:" + name, duration)
+
+    def clear(self):
+        self.samples.clear()
+
+    def stats(self):
+        """
+        Statistics of each phase, in milliseconds: mean, p50, p95, p99 and max
+        of the samples in the buffers, and the number of samples
+        """
+        result = {}
+        for phase, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[phase] = {
+                "count": len(ordered),
+                "mean": 1000 * sum(ordered) / len(ordered),
+                "p50": 1000 * percentile(ordered, 0.50),
+                "p95": 1000 * percentile(ordered, 0.95),
+                "p99": 1000 * percentile(ordered, 0.99),
+                "max": 1000 * ordered[-1],
+            }
+        return result
+
+    def dump_json(self, path):
+        with open(path, "w") as file_:
+            json.dump(self.stats(), file_, indent=2, sort_keys=True)
+
+    def dump_csv(self, path):
+        fields = ["phase", "count", "mean", "p50", "p95", "p99", "max"]
+        with open(path, "w") as file_:
+            writer = csv.writer(file_)
+            writer.writerow(fields)
+            for phase, values in sorted(self.stats().items()):
+                writer.writerow([phase] + [values[field] for field in fields[1:]])
+
+    def dump(self, path):
+        if path.endswith(".csv"):
+            self.dump_csv(path)
+        else:
+            self.dump_json(path)
+        logger.info("Profile written to '{}'".format(path))
+
+    def overlay_rows(self):
+        rows = [(u"ms", u"p50", u"p95", u"p99")]
+        for phase, values in sorted(self.stats().items(), key=lambda item: -item[1]["mean"])[:12]:
+            rows.append((phase,) + tuple(u"{:.2f}".format(values[key]) for key in ("p50", "p95", "p99")))
+        return rows
+
+    def overlay(self, font):
+        """
+        Image with the current statistics, rendered with the given
+        FontLoader - refreshed only every "overlay_refresh" calls
+        """
+        if self._overlay_image is None or self._overlay_age >= self.overlay_refresh:
+            rows = [[font.font.render(cell, True, font.color) for cell in row] for row in self.overlay_rows()]
+            columns = list(zip(*rows))
+            widths = [max(cell.get_width() for cell in column) + 8 for column in columns]
+            line_height = max(cell.get_height() for cell in rows[0])
+            image = pygame.Surface((sum(widths) + 8, line_height * len(rows) + 8), pygame.SRCALPHA)
+            image.fill((0, 0, 0, 192))
+            for row_number, row in enumerate(rows):
+                x = 4
+                for column_number, (cell, width) in enumerate(zip(row, widths)):
+                    # phase names aligned to the left, numbers to the right
+                    offset = 0 if column_number == 0 else width - 8 - cell.get_width()
+                    image.blit(cell, (x + offset, 4 + row_number * line_height))
+                    x += width
+            self._overlay_image = image
+            self._overlay_age = 0
+        self._overlay_age += 1
+        return self._overlay_image
+
+
+class PhaseTimer(object):
+    """
+    Times calls made through it, adding up their durations by phase - and,
+    for "by_class" phases, by the class of their argument - until "flush"
+    adds the totals to the profiler, as the samples of a tick or frame.
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.totals = {}
+        self.class_times = {}
+
+    def call(self, phase, function, *args):
+        start = clock()
+        try:
+            return function(*args)
+        finally:
+            self.totals[phase] = self.totals.get(phase, 0) + clock() - start
+
+    def wrap(self, phase, function, by_class=False):
+        """
+        Function timed in phase, called with a single argument
+        """
+        totals = self.totals
+        class_times = self.class_times
+        totals.setdefault(phase, 0)
+
+        def timed(item):
+            start = clock()
+            function(item)
+            duration = clock() - start
+            totals[phase] += duration
+            if by_class:
+                name = item.__class__.__name__
+                class_times[name] = class_times.get(name, 0) + duration
+
+        return timed
+
+    def flush(self):
+        for phase, duration in self.totals.items():
+            self.profiler.add(phase, duration)
+        self.profiler.add_actor_times(self.class_times)
+
+
+class NullTimer(object):
+    """
+    Stands for a PhaseTimer when not profiling: calls are made as they are
+    """
+
+    def call(self, phase, function, *args):
+        return function(*args)
+
+    def wrap(self, phase, function, by_class=False):
+        return function
+
+    def flush(self):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def profiler_from_environment():
+    """
+    A FrameProfiler if profiling is enabled by the environment, or None
+    """
+    setting = os.environ.get("MAPENGINE_PROFILE")
+    if not setting:
+        return None
+    profiler = FrameProfiler()
+    profiler.show_overlay = bool(os.environ.get("MAPENGINE_PROFILE_OVERLAY"))
+    if setting.endswith((".json", ".csv")):
+        profiler.output = setting
+    return profiler
@@ -0,0 +1,14 @@
+# coding: utf-8
+"""
+Registry of the GameObject classes, by lower case class name: map tiles and
+actors are looked up in it by the names of their palette colors.
+"""
+
+GameObjectClasses = {}
+
+
+class GameObjectRegistry(type):
+    def __new__(metacls, name, bases, dct):
+        cls = type.__new__(metacls, name, bases, dct)
+        GameObjectClasses[name.lower()] = cls
+        return cls
@@ -0,0 +1,237 @@
+# coding: utf-8
+"""
+Caches of pre-rendered map regions.
+
+Large map backgrounds are never materialized as a whole: they are
+rendered in square regions of a few blocks on demand, and the regions
+are kept in a least-recently-used cache limited by its size in bytes.
+"""
+
+from collections import OrderedDict
+import math
+
+import pygame
+
+
+def prepare_surface(surface, rle=False):
+    """
+    Converts surface to the pixel format of the display, so that blitting
+    it takes no per-pixel format conversion: surfaces with per-pixel alpha
+    keep it (convert_alpha), others are converted with "convert".
+
+    With "rle", run-length encoding acceleration is set for surfaces with
+    alpha or a colorkey - only use it for surfaces whose pixels are not
+    read, nor shared with subsurfaces.
+
+    Returns surface unchanged if no display is set (headless runs).
+    """
+    display = pygame.display.get_surface() if pygame.display.get_init() else None
+    if surface is None or display is None:
+        return surface
+    has_alpha = bool(surface.get_flags() & pygame.SRCALPHA)
+    if has_alpha:
+        # convert_alpha always yields 32 bit surfaces in this layout (ARGB or ABGR)
+        matches = surface.get_bitsize() == 32 and surface.get_masks()[:3] == display.get_masks()[:3]
+        if not matches:
+            surface = surface.convert_alpha()
+    elif surface.get_bitsize() != display.get_bitsize() or surface.get_masks() != display.get_masks():
+        surface = surface.convert()
+    if rle:
+        colorkey = surface.get_colorkey()
+        if colorkey is not None:
+            surface.set_colorkey(colorkey, pygame.RLEACCEL)
+        elif has_alpha:
+            surface.set_alpha(255, pygame.RLEACCEL)
+    return surface
+
+
+class RegionCache(object):
+    """
+    Base class for region caches: subclasses implement "build", returning the
+    surface for a region key, and set "full_size", the size in pixels of the whole area.
+    """
+
+    def __init__(self, blocksize, region_size=8, max_bytes=64 * 1024 * 1024):
+        self.blocksize = blocksize
+        self.region_size = region_size
+        self.region_pixels = region_size * blocksize
+        self.max_bytes = max_bytes
+        self.regions = OrderedDict()
+        self.bytes = 0
+        self.full_size = (0, 0)
+
+    def build(self, key):
+        raise NotImplementedError
+
+    @staticmethod
+    def surface_bytes(surface):
+        return surface.get_pitch() * surface.get_height()
+
+    def region(self, key):
+        try:
+            self.regions.move_to_end(key)
+            return self.regions[key]
+        except KeyError:
+            pass
+        surface = self.regions[key] = self.build(key)
+        self.bytes += self.surface_bytes(surface)
+        # Always keep the newest region, even if it is over budget by itself
+        while self.bytes > self.max_bytes and len(self.regions) > 1:
+            self.invalidate(next(iter(self.regions)))
+        return surface
+
+    def invalidate(self, key):
+        surface = self.regions.pop(key, None)
+        if surface is not None:
+            self.bytes -= self.surface_bytes(surface)
+
+    def clear(self):
+        self.regions.clear()
+        self.bytes = 0
+
+    def blit(self, target, dest, area):
+        """
+        Blits area - (left, top, width, height), in pixels of the full size
+        background - to target at dest. As with Surface.blit, the parts of area
+        outside the background are clipped, and dest is moved accordingly.
+        """
+        left, top, width, height = area
+        right = min(left + width, self.full_size[0])
+        bottom = min(top + height, self.full_size[1])
+        step = self.region_pixels
+        for region_top in range(max(0, top) // step * step, bottom, step):
+            for region_left in range(max(0, left) // step * step, right, step):
+                x0 = max(left, region_left)
+                y0 = max(top, region_top)
+                x1 = min(right, region_left + step)
+                y1 = min(bottom, region_top + step)
+                if x1 <= x0 or y1 <= y0:
+                    continue
+                surface = self.region((region_left // step, region_top // step))
+                target.blit(
+                    surface, (dest[0] + x0 - left, dest[1] + y0 - top),
+                    area=(x0 - region_left, y0 - region_top, x1 - x0, y1 - y0)
+                )
+
+
+class OverlayRegions(RegionCache):
+    """
+    Overlay background image zoomed to the scene block resolution, one region at a time.
+    """
+
+    def __init__(self, source, width, blocksize, **kw):
+        super(OverlayRegions, self).__init__(blocksize, **kw)
+        self.source = source
+        self.ratio = float(width * blocksize) / source.get_width()
+        self.full_size = (
+            int(source.get_width() * self.ratio),
+            int(source.get_height() * self.ratio),
+        )
+
+    def build(self, key):
+        ratio = self.ratio
+        step = self.region_pixels
+        left, top = key[0] * step, key[1] * step
+        width = min(step, self.full_size[0] - left)
+        height = min(step, self.full_size[1] - top)
+        # Source pixels covering the region, with a one pixel border,
+        # so that interpolation at the region edges matches its neighbours
+        source_width, source_height = self.source.get_size()
+        source_left = max(0, int(math.floor(left / ratio)) - 1)
+        source_top = max(0, int(math.floor(top / ratio)) - 1)
+        source_right = min(source_width, int(math.ceil((left + width) / ratio)) + 1)
+        source_bottom = min(source_height, int(math.ceil((top + height) / ratio)) + 1)
+        part = self.source.subsurface(
+            (source_left, source_top, source_right - source_left, source_bottom - source_top)
+        )
+        scaled = pygame.transform.rotozoom(part, 0, ratio)
+        offset_x = int(round(left - source_left * ratio))
+        offset_y = int(round(top - source_top * ratio))
+        area = pygame.Rect(offset_x, offset_y, width, height).clip(scaled.get_rect())
+        return prepare_surface(scaled.subsurface(area).copy())
+
+
+class TileRegions(RegionCache):
+    """
+    Block tiles of a scene, pre-composited in regions, so that the static
+    background is drawn with a handful of blits instead of one per block.
+    Regions have to be invalidated when a tile in them changes.
+
+    Tiles that are GameObjects of their own - not "shared" - may change
+    their image at any time: "repaint_changed" checks them, and paints
+    the new images over the regions.
+    """
+
+    def __init__(self, scene, **kw):
+        super(TileRegions, self).__init__(scene.blocksize, **kw)
+        self.scene = scene
+        self.full_size = (scene.width * scene.blocksize, scene.height * scene.blocksize)
+        # per region: {position: [tile object, image painted]} for non shared tiles
+        self.objects = {}
+
+    def invalidate_position(self, position):
+        self.invalidate((position[0] // self.region_size, position[1] // self.region_size))
+
+    def invalidate(self, key):
+        super(TileRegions, self).invalidate(key)
+        self.objects.pop(key, None)
+
+    def clear(self):
+        super(TileRegions, self).clear()
+        self.objects.clear()
+
+    def paint(self, surface, image, dest):
+        blocksize = self.blocksize
+        if isinstance(image, pygame.Surface):
+            surface.blit(image, dest)
+        else:
+            surface.fill(image, (dest[0], dest[1], blocksize, blocksize))
+
+    def build(self, key):
+        scene = self.scene
+        size = self.region_size
+        blocksize = self.blocksize
+        left, top = key[0] * size, key[1] * size
+        width = min(size, scene.width - left)
+        height = min(size, scene.height - top)
+        surface = pygame.Surface((width * blocksize, height * blocksize))
+        surface.fill(scene.out_of_map)
+        objects = {}
+        for x in range(width):
+            for y in range(height):
+                tile = scene[left + x, top + y]
+                image = tile.image if hasattr(tile, "image") else tile
+                if hasattr(tile, "image") and not tile.shared:
+                    objects[left + x, top + y] = [tile, image]
+                self.paint(surface, image, (x * blocksize, y * blocksize))
+        if objects:
+            self.objects[key] = objects
+        return surface
+
+    def repaint_changed(self, x0, y0, x1, y1):
+        """
+        Paints the new images of the non shared tiles in x0 <= x < x1 and
+        y0 <= y < y1 that changed them over their built regions - returns
+        the positions repainted.
+        """
+        if not self.objects:
+            return []
+        size = self.region_size
+        blocksize = self.blocksize
+        repainted = []
+        for region_x in range(max(0, x0) // size, max(0, x1 - 1) // size + 1):
+            for region_y in range(max(0, y0) // size, max(0, y1 - 1) // size + 1):
+                objects = self.objects.get((region_x, region_y))
+                if not objects:
+                    continue
+                surface = self.regions[region_x, region_y]
+                for position, painted in objects.items():
+                    tile, image = painted
+                    if tile.image is image or not (x0 <= position[0] < x1 and y0 <= position[1] < y1):
+                        continue
+                    painted[1] = tile.image
+                    dest = ((position[0] - region_x * size) * blocksize, (position[1] - region_y * size) * blocksize)
+                    surface.fill(self.scene.out_of_map, (dest[0], dest[1], blocksize, blocksize))
+                    self.paint(surface, tile.image, dest)
+                    repainted.append(position)
+        return repainted
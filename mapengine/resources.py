@@ -0,0 +1,222 @@
+# coding: utf-8
+"""
+Index of the resource search roots.
+
+Each root in a search path - a directory or a zip archive - is listed once,
+and lookups are answered from those listings and remembered, including
+misses, so that finding a resource makes no filesystem calls after the
+first lookup.
+
+A root can be a zip archive, or a directory inside one: a search path entry
+"game.zip/scenes" finds "game.zip/scenes/map.png" in the archive. Archive
+members are read directly from the archive, with no extraction to disk.
+"""
+
+import logging
+import os
+import posixpath
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+
+def add_path(paths, path):
+    """
+    Adds path to the end of the search path list "paths" - the end is
+    searched first. A path already in the list is moved to the end,
+    so that lists which are appended to repeatedly do not grow.
+    """
+    path = os.path.normpath(path)
+    if path in paths:
+        if paths[-1] == path:
+            return
+        paths.remove(path)
+    paths.append(path)
+
+
+def split_archive(path):
+    """
+    Splits a path going into a zip archive in (archive path, path inside archive).
+    Returns None if path is not in an archive.
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    for index in range(len(parts), 0, -1):
+        candidate = os.sep.join(parts[:index])
+        if not candidate or not os.path.isfile(candidate):
+            continue
+        if zipfile.is_zipfile(candidate):
+            return candidate, "/".join(parts[index:])
+        return None
+    return None
+
+
+class DirectoryRoot(object):
+    """
+    A search root in the filesystem. Each directory is listed
+    the first time a name in it is looked up.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.listings = {}
+
+    def _listing(self, directory):
+        try:
+            return self.listings[directory]
+        except KeyError:
+            pass
+        try:
+            listing = frozenset(os.listdir(directory))
+        except OSError:
+            listing = frozenset()
+        self.listings[directory] = listing
+        return listing
+
+    def path_of(self, name):
+        return os.path.join(self.path, name)
+
+    def __contains__(self, name):
+        directory, basename = os.path.split(os.path.normpath(self.path_of(name)))
+        return basename in self._listing(directory)
+
+    def open(self, name):
+        return open(self.path_of(name), "rb")
+
+    def source(self, name):
+        # loaders get filesystem paths as they are
+        return self.path_of(name)
+
+
+class ArchiveRoot(object):
+    """
+    A search root inside a zip archive: the archive member names
+    are its index. The archive is kept open, and members are opened
+    as seekable file objects, read straight from it.
+    """
+    def __init__(self, path, archive, prefix=""):
+        self.path = path
+        self.archive_path = archive
+        self.prefix = prefix
+        self.archive = zipfile.ZipFile(archive)
+        self.names = frozenset(self.archive.namelist())
+
+    def member(self, name):
+        return posixpath.normpath(posixpath.join(self.prefix, name.replace(os.sep, "/")))
+
+    def path_of(self, name):
+        return os.path.join(self.path, name)
+
+    def __contains__(self, name):
+        return self.member(name) in self.names
+
+    def open(self, name):
+        return self.archive.open(self.member(name))
+
+    def source(self, name):
+        return self.open(name)
+
+    def close(self):
+        self.archive.close()
+
+
+class ResourceManager(object):
+    """
+    Finds resources in lists of search roots, searched from the last one
+    to the first.
+
+    Roots are indexed when first used: files added to a root afterwards are
+    only found after "refresh" is called.
+    """
+
+    def __init__(self):
+        self.roots = {}
+        self.lookups = {}
+
+    def root(self, path):
+        path = os.path.normpath(path)
+        try:
+            return self.roots[path]
+        except KeyError:
+            pass
+        archive = None if os.path.isdir(path) else split_archive(path)
+        if archive:
+            root = ArchiveRoot(path, *archive)
+        else:
+            root = DirectoryRoot(path)
+        self.roots[path] = root
+        return root
+
+    def find(self, filename, paths):
+        """
+        (root, filename) for the root where filename is found, or None
+        """
+        key = (filename, tuple(paths))
+        try:
+            return self.lookups[key]
+        except KeyError:
+            pass
+        found = None
+        for path in reversed(paths):
+            root = self.root(path)
+            if filename in root:
+                found = (root, filename)
+                break
+        self.lookups[key] = found
+        return found
+
+    def path(self, filename, paths):
+        """
+        Path of filename in the search path - paths inside archives have
+        the archive path as a prefix, and can be passed to "open" and "source".
+        """
+        found = self.find(filename, paths)
+        if found is None:
+            return None
+        root, name = found
+        return root.path_of(name)
+
+    def _locate(self, path):
+        if os.path.exists(path):
+            return None
+        archive = split_archive(path)
+        if archive is None:
+            return None
+        root = self.root(archive[0])
+        return root, archive[1]
+
+    def open(self, path):
+        """
+        Binary file object for a path returned by "path"
+        """
+        located = self._locate(path)
+        if located is None:
+            return open(path, "rb")
+        root, name = located
+        return root.open(name)
+
+    def source(self, path):
+        """
+        What loaders are given for a path returned by "path": the path
+        itself for files, or an open file object for archive members.
+        """
+        located = self._locate(path)
+        if located is None:
+            return path
+        root, name = located
+        return root.source(name)
+
+    def in_archive(self, path):
+        return self._locate(path) is not None
+
+    def refresh(self):
+        """
+        Drops all indexes and remembered lookups, so that changes
+        on disk are seen.
+        """
+        for root in self.roots.values():
+            if isinstance(root, ArchiveRoot):
+                root.close()
+        self.roots.clear()
+        self.lookups.clear()
+
+
+resources = ResourceManager()
@@ -0,0 +1,123 @@
+# coding: utf-8
+"""
+Delayed events, kept in a single heap ordered by the controller tick
+at which they are due - so pending events cost nothing until they fire.
+"""
+
+import heapq
+from itertools import count
+
+
+class Event(object):
+    """
+    Sets "attribute" to "value" on the object it is added to, once "countdown"
+    frames have passed. If "attribute" is callable it is called instead,
+    with "value" as argument - or with no arguments if value is None, or with
+    the items of value as arguments if it is a list.
+    """
+    def __init__(self, countdown, attribute, value):
+        self.countdown = countdown
+        self.attribute = attribute
+        self.value = value
+        self.due = None
+        self.cancelled = False
+
+    def fire(self, target):
+        if callable(self.attribute):
+            if self.value is None:
+                args = []
+            elif isinstance(self.value, list):
+                args = self.value
+            else:
+                args = [self.value]
+            self.attribute(*args)
+        else:
+            setattr(target, self.attribute, self.value)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __repr__(self):
+        return "<Event {!r}={!r} due at {}>".format(self.attribute, self.value, self.due)
+
+
+class Scheduler(object):
+    """
+    Fires Events at the controller tick they are due.
+    Cancelled events are only dropped from the heap when they reach its top.
+    """
+
+    def __init__(self):
+        self.tick = 0
+        self.heap = []
+        self._counter = count()
+
+    def __len__(self):
+        return sum(1 for _, _, event, _ in self.heap if not event.cancelled)
+
+    def schedule(self, event, target):
+        # An event with countdown N fires at the (N + 2)th frame, as
+        # when each object counted its events down to -1 by itself
+        event.due = self.tick + event.countdown + 2
+        event.cancelled = False
+        # the counter keeps events due at the same tick in the order they were scheduled
+        heapq.heappush(self.heap, (event.due, next(self._counter), event, target))
+        return event
+
+    def run(self, tick):
+        """
+        Advances to "tick", firing all events due up to it
+        """
+        self.tick = tick
+        heap = self.heap
+        while heap and heap[0][0] <= tick:
+            _, _, event, target = heapq.heappop(heap)
+            if event.cancelled:
+                continue
+            event.cancelled = True
+            event.fire(target)
+
+
+class ObjectEvents(object):
+    """
+    The pending events of a game object - the "events" attribute of
+    GameObjects. Adding an event schedules it in the controller scheduler,
+    and removing it cancels it.
+    """
+
+    def __init__(self, owner, scheduler):
+        self.owner = owner
+        self.scheduler = scheduler
+        self.pending = []
+
+    def _prune(self):
+        self.pending = [event for event in self.pending if not event.cancelled]
+
+    def add(self, event):
+        if len(self.pending) > 8:
+            self._prune()
+        self.pending.append(event)
+        self.scheduler.schedule(event, self.owner)
+
+    def remove(self, event):
+        event.cancel()
+        self._prune()
+
+    def discard(self, event):
+        self.remove(event)
+
+    def clear(self):
+        for event in self.pending:
+            event.cancel()
+        self.pending = []
+
+    def __iter__(self):
+        return iter([event for event in self.pending if not event.cancelled])
+
+    def __len__(self):
+        return sum(1 for event in self.pending if not event.cancelled)
+
+    def __bool__(self):
+        return bool(len(self))
+
+    __nonzero__ = __bool__
@@ -0,0 +1,122 @@
+# coding: utf-8
+"""
+Grid bucketed spatial index of the actors in a scene.
+"""
+
+from itertools import count
+
+
+class SpatialIndex(object):
+    """
+    Keeps actors in buckets of "cell_size" x "cell_size" blocks by their
+    position, so that the actors close to a position can be found without
+    checking every actor in the scene.
+
+    The index must be told when an actor moves (GameObject.pos does it) - and results
+    are given in the order actors were added to the index, which is the order
+    the controller's sprite groups iterate over them.
+
+    "observer", if given, has its "cell_changed(position, occupied)" method
+    called when the first actor enters a cell, and when the last one leaves it.
+    """
+
+    def __init__(self, cell_size=4, observer=None):
+        self.cell_size = cell_size
+        self.observer = observer
+        self.buckets = {}
+        self.cells = {}
+        self.positions = {}
+        self.order = {}
+        self._counter = count()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, actor):
+        return actor in self.positions
+
+    def _bucket(self, pos):
+        return (pos[0] // self.cell_size, pos[1] // self.cell_size)
+
+    def _insert(self, actor, pos):
+        # Vectors are tuples already, and immutable
+        if not isinstance(pos, tuple):
+            pos = (pos[0], pos[1])
+        self.positions[actor] = pos
+        self.buckets.setdefault(self._bucket(pos), set()).add(actor)
+        cell = self.cells.get(pos)
+        if cell is None:
+            cell = self.cells[pos] = []
+            if self.observer is not None:
+                self.observer.cell_changed(pos, True)
+        cell.append(actor)
+
+    def _discard(self, actor):
+        pos = self.positions.pop(actor)
+        bucket_key = self._bucket(pos)
+        bucket = self.buckets[bucket_key]
+        bucket.discard(actor)
+        if not bucket:
+            del self.buckets[bucket_key]
+        cell = self.cells[pos]
+        cell.remove(actor)
+        if not cell:
+            del self.cells[pos]
+            if self.observer is not None:
+                self.observer.cell_changed(pos, False)
+
+    def add(self, actor):
+        if actor in self.positions:
+            return
+        self.order[actor] = next(self._counter)
+        self._insert(actor, actor.pos)
+
+    def remove(self, actor):
+        if actor not in self.positions:
+            return
+        self._discard(actor)
+        del self.order[actor]
+
+    def move(self, actor):
+        """
+        Updates the index with the current position of actor
+        """
+        old_pos = self.positions.get(actor)
+        if old_pos is None or old_pos == actor.pos:
+            return
+        self._discard(actor)
+        self._insert(actor, actor.pos)
+
+    def at(self, pos):
+        """
+        The most recently added actor at the given position - or None
+        """
+        cell = self.cells.get(pos if isinstance(pos, tuple) else (pos[0], pos[1]))
+        if not cell:
+            return None
+        return max(cell, key=self.order.__getitem__)
+
+    def near(self, pos, radius=1):
+        """
+        Actors in the buckets within "radius" buckets from the one of pos,
+        in the order they were added.
+        """
+        bucket_x, bucket_y = self._bucket(pos)
+        found = []
+        buckets = self.buckets
+        for x in range(bucket_x - radius, bucket_x + radius + 1):
+            for y in range(bucket_y - radius, bucket_y + radius + 1):
+                bucket = buckets.get((x, y))
+                if bucket:
+                    found.extend(bucket)
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def colliding(self, actor, collided):
+        """
+        Same as pygame.sprite.spritecollide(actor, <all indexed actors>, False, collided),
+        with candidates only from the buckets around actor.
+        Actor rectangles may lag their positions by a move, which the
+        neighbour buckets cover as long as cell_size is a few blocks.
+        """
+        return [other for other in self.near(actor.pos) if collided(actor, other)]
@@ -1,9 +1,13 @@
 # coding: utf-8
 
+from collections import deque, namedtuple
 import logging
+import math
 import os, sys
+import time
 
 from .exceptions import BaseGameException
+from .resources import resources
 
 logger = logging.getLogger(__name__)
 
@@ -24,92 +28,126 @@ def pwd(back=1):
 
 
 def plain_loader(path):
+    if hasattr(path, "read"):
+        return path.read()
     with open(path, "rb") as file:
         return file.read()
 
 
+def resource_path(filename, paths=None):
+    """
+    Returns the path where resource_load would find the given file,
+    or None if it is not found
+    """
+    if paths is None:
+        paths = ["."]
+    return resources.path(filename, paths)
+
+
 def resource_load(filename, paths=None, cache=None, prefix=None, default=None, force=False, loader=None, cache_extra=""):
+    """
+    Loads filename from the last of paths it is found in, with loader - which
+    is given the file path, or an open binary file object for files in zip archives.
+    """
     if loader is None:
         loader = plain_loader
     if paths is None:
         paths = ["."]
-    path_not_found = False
-    for directory in reversed(paths):
-        path = os.path.join(directory, filename)
-        if cache and path in cache and not force:
-            logger.debug("Using cached resource for '{}'".format(path))
-            return cache[path]
-        if os.path.exists(path):
-            break
+    found = resources.find(filename, paths)
+    if found is None:
+        path = os.path.join(paths[0], filename)
     else:
-        path_not_found = True
+        root, name = found
+        path = root.path_of(name)
+    key = path + cache_extra
+    if cache and key in cache and not force:
+        logger.debug("Using cached resource for '{}'".format(path))
+        return cache[key]
     try:
-        if path_not_found:
+        if found is None:
             raise BaseGameException("Resource path not found - {} at {} ".format(filename, paths))
         logger.debug("Loading resource at '{}'".format(path))
-        resource = loader(path)
+        resource = loader(root.source(name))
     except Exception as exc:
         resource = default
         if force:
             logger.error("Failed to load resource at '{}' as well as path folders: {}. Error found: {}".format(path, paths, exc))
     if cache is not None:
-        cache[path + cache_extra] = resource
+        cache[key] = resource
     return resource
 
 
-class Vector(object):
-    __slots__ = ["x", "y"]
+class RateMeter(object):
+    """
+    Measures how many times per second "mark" is called, over the last "window" seconds
+    """
+    def __init__(self, window=1.0):
+        self.window = window
+        self.marks = deque()
 
-    def __init__(self, pos):
-        self.x = pos[0]
-        self.y = pos[1]
+    def mark(self, now=None):
+        if now is None:
+            now = time.perf_counter()
+        marks = self.marks
+        marks.append(now)
+        while now - marks[0] > self.window:
+            marks.popleft()
 
-    def __len__(self):
-        return 2
+    @property
+    def rate(self):
+        if len(self.marks) < 2:
+            return 0.0
+        span = self.marks[-1] - self.marks[0]
+        return (len(self.marks) - 1) / span if span else 0.0
 
-    def __getitem__(self, index):
-        if index==0:
-            return self.x
-        if index==1:
-            return self.y
-        raise IndexError
 
-    def __setitem__(self, index, value):
-        if index == 0:
-            self.x = value
-        elif index == 1:
-            self.y == value
-        else:
-            raise IndexError
+_new_tuple = tuple.__new__
 
-    def __eq__(self, other):
-        return self.x == other[0] and self.y == other[1]
+
+class Vector(namedtuple("Vector", "x y")):
+    """
+    Immutable 2D vector - a tuple of (x, y), so that it can be used
+    anywhere a position tuple is expected, and is hashed and compared
+    as fast as one: Vector((1, 2)) == (1, 2), and both are the same
+    dictionary key.
+    """
+    __slots__ = ()
+
+    def __new__(cls, pos):
+        # Vectors are immutable: re-wrapping one can hand it back as is
+        if type(pos) is cls:
+            return pos
+        if type(pos) is tuple and len(pos) == 2:
+            return _new_tuple(cls, pos)
+        return _new_tuple(cls, (pos[0], pos[1]))
 
     def __add__(self, other):
-        return Vector((self.x + other[0], self.y + other[1]))
+        return _new_tuple(Vector, (self[0] + other[0], self[1] + other[1]))
 
-    def __radd__(self, other):
-        return Vector((self.x + other[0], self.y + other[1]))
+    __radd__ = __add__
 
     def __sub__(self, other):
-        return Vector((self.x - other[0], self.y - other[1]))
+        return _new_tuple(Vector, (self[0] - other[0], self[1] - other[1]))
 
     def __mul__(self, other):
-        return Vector((self.x * other, self.y * other))
+        return _new_tuple(Vector, (self[0] * other, self[1] * other))
+
+    # tuple would repeat itself instead
+    __rmul__ = __mul__
 
-    def __div__(self, other):
-        return Vector((self.x // other, self.y // other))
+    def __floordiv__(self, other):
+        return _new_tuple(Vector, (self[0] // other, self[1] // other))
 
     def __truediv__(self, other):
-        return Vector((self.x / float(other), self.y / float(other)))
+        return _new_tuple(Vector, (self[0] / float(other), self[1] / float(other)))
 
     def distance(self, other):
-        return ((self.x - other[0]) ** 2, (self.y - other[1]) ** 2) ** 0.5
+        return math.hypot(self[0] - other[0], self[1] - other[1])
 
     def __repr__(self):
-        return "Vector(({:g},{:g}))".format(self.x, self.y)
+        return "Vector(({:g},{:g}))".format(self[0], self[1])
 
-    def __hash__(self):
-        return hash((self.x, self.y))
+    def __getnewargs__(self):
+        return (tuple(self),)
 
 V = Vector
@@ -0,0 +1,62 @@
+# coding: utf-8
+"""
+Scenes for the tests, drawn from rows of text: "#" is a wall, "." is floor.
+"""
+
+import itertools
+import os
+
+# Must be set before pygame initializes the display
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+import pytest
+
+from mapengine.base import Controller, GameObject, Scene, add_scene_path
+
+FLOOR_COLOR = (200, 200, 200)
+WALL_COLOR = (90, 90, 91)
+
+_names = itertools.count()
+
+
+class Testwall(GameObject):
+    hardness = 5
+    shared = True
+
+
+def write_scene(directory, name, rows):
+    width, height = len(rows[0]), len(rows)
+    plane = pygame.Surface((width, height))
+    for y, row in enumerate(rows):
+        for x, char in enumerate(row):
+            plane.set_at((x, y), WALL_COLOR if char == "#" else FLOOR_COLOR)
+    actors = pygame.Surface((width, height), pygame.SRCALPHA)
+    actors.fill((0, 0, 0, 0))
+    pygame.image.save(plane, os.path.join(directory, name + ".png"))
+    pygame.image.save(actors, os.path.join(directory, name + "_actors.png"))
+    with open(os.path.join(directory, name + ".gpl"), "w") as file_:
+        file_.write("GIMP Palette\nName: {}\n#\n".format(name))
+        file_.write("{} {} {} testfloor\n".format(*FLOOR_COLOR))
+        file_.write("{} {} {} testwall\n".format(*WALL_COLOR))
+
+
+@pytest.fixture
+def make_controller(tmp_path):
+    """
+    Builds a headless controller for a scene drawn from rows of text
+    """
+    pygame.init()
+    add_scene_path(str(tmp_path))
+
+    def make(rows, **scene_options):
+        name = "testscene{}".format(next(_names))
+        write_scene(str(tmp_path), name, rows)
+        return Controller((800, 600), Scene(name, **scene_options), headless=True)
+
+    return make
+
+
+def random_rows(rng, width, height, wall_ratio):
+    return ["".join("#" if rng.random() < wall_ratio else "." for _ in range(width)) for _ in range(height)]
@@ -0,0 +1,49 @@
+# coding: utf-8
+import pytest
+
+pytest.importorskip("numpy")
+
+from mapengine.base import Actor
+
+
+class Chunkwalker(Actor):
+    killed = 0
+
+    def kill(self):
+        # game effects, as scores or death cuts
+        Chunkwalker.killed += 1
+        super(Chunkwalker, self).kill()
+
+
+@pytest.fixture
+def chunked(make_controller, tmp_path):
+    Chunkwalker.killed = 0
+    rows = ["." * 64] * 64
+    return make_controller(rows, chunk_size=8, compiled_cache=str(tmp_path / "cache"), suspended_chunks=1)
+
+
+def test_actors_walking_into_inactive_chunks_are_suspended(chunked):
+    controller = chunked
+    loader = controller.scene.chunk_loader
+    actor = controller.spawn_actor(Chunkwalker, (1, 1))
+    assert loader.key((60, 60)) not in loader.active
+    actor.pos = (60, 60)
+    assert actor not in controller.all_actors
+    assert actor not in controller.actor_index
+    assert controller.hardness_at((60, 60)) == 0
+    assert loader.suspended[loader.key((60, 60))] == [actor]
+
+
+def test_suspended_actors_over_the_cap_are_dropped_without_kill(chunked):
+    controller = chunked
+    loader = controller.scene.chunk_loader
+    first = controller.spawn_actor(Chunkwalker, (1, 1))
+    second = controller.spawn_actor(Chunkwalker, (2, 1))
+    first.pos = (60, 60)
+    second.pos = (60, 40)
+    # only one chunk of suspended actors is kept
+    assert list(loader.suspended) == [loader.key((60, 40))]
+    assert loader.key((60, 60)) not in loader.spawned
+    assert Chunkwalker.killed == 0
+    assert not first.alive()
+    assert not list(first.events)
@@ -0,0 +1,85 @@
+# coding: utf-8
+import random
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from mapengine.base import Actor
+from mapengine.flowfield import (
+    padded_distances, distance_field, direction_field, repair_distances,
+    repair_directions, tile_hardness,
+)
+
+STRENGTH = 4
+STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class Flowrunner(Actor):
+    pass
+
+
+def random_rows(seed, width, height, wall_ratio):
+    rng = random.Random(seed)
+    return ["".join("#" if rng.random() < wall_ratio else "." for _ in range(width)) for _ in range(height)]
+
+
+def step(rng, passable, position):
+    """
+    A random passable neighbour of position - or position itself, with none
+    """
+    width, height = passable.shape
+    steps = list(STEPS)
+    rng.shuffle(steps)
+    for dx, dy in steps:
+        x, y = position[0] + dx, position[1] + dy
+        if 0 <= x < width and 0 <= y < height and passable[x, y]:
+            return (x, y)
+    return position
+
+
+@pytest.mark.parametrize("wall_ratio", [0.0, 0.2, 0.35])
+def test_repair_matches_full_computation(wall_ratio):
+    rng = numpy.random.RandomState(int(wall_ratio * 100))
+    passable = rng.random_sample((40, 30)) >= wall_ratio
+    target = tuple(numpy.argwhere(passable)[0].tolist())
+    padded = padded_distances(passable, [target])
+    directions = direction_field(padded[1:-1, 1:-1])
+    walk = random.Random(1)
+    for _ in range(200):
+        new_target = step(walk, passable, target)
+        if new_target == target:
+            break
+        closer = repair_distances(padded, new_target)
+        repair_directions(directions, padded, closer)
+        target = new_target
+        expected = padded_distances(passable, [target])
+        assert (padded == expected).all()
+        assert (directions == direction_field(expected[1:-1, 1:-1])).all()
+
+
+def test_field_follows_actor_and_tile_changes(make_controller):
+    controller = make_controller(random_rows(6, 40, 30, 0.2))
+    scene = controller.scene
+    rng = random.Random(6)
+    passable = tile_hardness(scene) <= STRENGTH
+    start = tuple(numpy.argwhere(passable)[len(numpy.argwhere(passable)) // 2].tolist())
+    leader = controller.spawn_actor(Flowrunner, start)
+    field = controller.flow_field(STRENGTH, leader)
+    for move in range(120):
+        passable = tile_hardness(scene) <= STRENGTH
+        leader.pos = step(rng, passable, leader.pos)
+        if move % 20 == 10:
+            # walls come and go, away from the leader
+            for _ in range(5):
+                position = (rng.randrange(scene.width), rng.randrange(scene.height))
+                if position != tuple(leader.pos):
+                    scene[position] = "testfloor" if scene.hardness_grid.at(*position) else "testwall"
+        controller.tick += 1
+        field.refresh()
+        passable = tile_hardness(scene) <= STRENGTH
+        expected = distance_field(passable, [tuple(leader.pos)])
+        assert (field.distances == expected).all()
+        assert (field.directions == direction_field(expected)).all()
+    assert field.repaired
+    assert field.computed > 1
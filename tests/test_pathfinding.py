@@ -0,0 +1,166 @@
+# coding: utf-8
+from collections import deque
+import random
+
+import pytest
+
+from mapengine.base import Actor
+from mapengine.pathfinding import PathFinder
+
+STRENGTH = 4
+
+
+def random_rows(seed, width, height, wall_ratio):
+    rng = random.Random(seed)
+    return ["".join("#" if rng.random() < wall_ratio else "." for _ in range(width)) for _ in range(height)]
+
+
+def passable(scene, position):
+    x, y = position
+    return 0 <= x < scene.width and 0 <= y < scene.height and scene.hardness_grid.at(x, y) <= STRENGTH
+
+
+def shortest(scene, start, goal):
+    """
+    Length of the shortest path from start to goal, by breadth first search - or None
+    """
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        position = queue.popleft()
+        if position == goal:
+            return distances[position]
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            other = (position[0] + dx, position[1] + dy)
+            if other not in distances and passable(scene, other):
+                distances[other] = distances[position] + 1
+                queue.append(other)
+    return None
+
+
+def check_path(scene, start, goal, path):
+    previous = start
+    for position in path:
+        assert abs(position[0] - previous[0]) + abs(position[1] - previous[1]) == 1, (previous, position)
+        assert passable(scene, position), position
+        previous = position
+    assert previous == goal
+    # no cell is walked twice
+    assert len(set(path)) == len(path)
+    assert start not in path
+
+
+def free_cells(scene, rng, count):
+    cells = [(x, y) for x in range(scene.width) for y in range(scene.height) if passable(scene, (x, y))]
+    return [rng.choice(cells) for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_paths_are_valid(make_controller, seed):
+    controller = make_controller(random_rows(seed, 48, 40, 0.25))
+    scene = controller.scene
+    rng = random.Random(seed)
+    cells = free_cells(scene, rng, 120)
+    for start, goal in zip(cells[::2], cells[1::2]):
+        path = controller.find_path(start, goal, STRENGTH)
+        length = shortest(scene, start, goal)
+        if length is None:
+            assert path is None, (start, goal)
+            continue
+        assert path is not None, (start, goal)
+        check_path(scene, start, goal, path)
+        assert len(path) >= length
+
+
+def test_start_is_goal(make_controller):
+    controller = make_controller(random_rows(3, 20, 20, 0.1))
+    assert controller.find_path((0, 0), (0, 0), STRENGTH) == []
+
+
+def test_unreachable_goal(make_controller):
+    controller = make_controller([
+        "..........",
+        "......###.",
+        "......#.#.",
+        "......###.",
+        "..........",
+    ])
+    # walled in
+    assert controller.find_path((0, 0), (7, 2), STRENGTH) is None
+    # a wall itself, and off the map
+    assert controller.find_path((0, 0), (6, 1), STRENGTH) is None
+    assert controller.find_path((0, 0), (10, 0), STRENGTH) is None
+    # but strong enough actors walk through walls
+    assert controller.find_path((0, 0), (7, 2), 5)
+
+
+def test_tile_changed_matches_fresh_finder(make_controller):
+    controller = make_controller(random_rows(4, 64, 48, 0.2))
+    scene = controller.scene
+    rng = random.Random(4)
+    cells = free_cells(scene, rng, 80)
+    pairs = list(zip(cells[::2], cells[1::2]))
+    for start, goal in pairs:
+        controller.find_path(start, goal, STRENGTH)
+    # walls across the paths found, and some opened
+    for start, goal in pairs[:10]:
+        path = controller.find_path(start, goal, STRENGTH)
+        if path and len(path) > 2:
+            scene[path[len(path) // 2]] = "testwall"
+    for _ in range(20):
+        position = (rng.randrange(scene.width), rng.randrange(scene.height))
+        if not passable(scene, position):
+            scene[position] = "testfloor"
+    fresh = PathFinder(scene)
+    for start, goal in pairs:
+        if not (passable(scene, start) and passable(scene, goal)):
+            continue
+        path = controller.find_path(start, goal, STRENGTH)
+        expected = fresh.find_path(start, goal, STRENGTH)
+        assert (path is None) == (expected is None), (start, goal)
+        if path is not None:
+            check_path(scene, start, goal, path)
+            assert len(path) == len(expected)
+
+
+def test_reused_routes_do_not_repeat_cells(make_controller):
+    controller = make_controller(random_rows(5, 96, 64, 0.15))
+    scene = controller.scene
+    controller.find_path((0, 0), (0, 0), STRENGTH)
+    finder = controller.pathfinder
+    rng = random.Random(5)
+
+    def border_cell(cluster):
+        # start and goal on cluster borders are transition cells of the routes
+        x0, y0, x1, y1 = finder.cluster_bounds(cluster)
+        while True:
+            position = (rng.choice([x0, x1 - 1]), rng.randrange(y0, y1))
+            if passable(scene, position):
+                return position
+
+    clusters = [(0, 0), (5, 3), (2, 3), (4, 0)]
+    checked = 0
+    for start_cluster, goal_cluster in zip(clusters, clusters[1:] + clusters[:1]):
+        for _ in range(40):
+            start, goal = border_cell(start_cluster), border_cell(goal_cluster)
+            path = controller.find_path(start, goal, STRENGTH)
+            if path is not None:
+                check_path(scene, start, goal, path)
+                checked += 1
+    assert checked
+    assert finder.graph(STRENGTH).routes
+
+
+class Pathwalker(Actor):
+    arrived = 0
+
+    def on_arrival(self):
+        self.arrived += 1
+
+
+def test_go_to_own_position_arrives(make_controller):
+    controller = make_controller(random_rows(6, 20, 20, 0.0))
+    actor = controller.spawn_actor(Pathwalker, (3, 4))
+    assert actor.go_to((3, 4))
+    assert actor.arrived == 1
+    assert actor.path is None